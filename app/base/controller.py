@@ -116,6 +116,9 @@ class ControllerBase(QObject):
         audio = getattr(self.model, "audio", None)
         if audio is not None:
             audio.start()
+        camera = getattr(self.model, "camera", None)
+        if camera is not None:
+            camera.resume()
         self.model.audio_is_stream = True
         self.model.camera_is_stream = True
 
@@ -124,5 +127,8 @@ class ControllerBase(QObject):
         audio = getattr(self.model, "audio", None)
         if audio is not None:
             audio.stop()
+        camera = getattr(self.model, "camera", None)
+        if camera is not None:
+            camera.pause()
         self.model.audio_is_stream = False
         self.model.camera_is_stream = False
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Callable, Optional
 
 from PyQt5 import uic
 from PyQt5.QtCore import QTimer, pyqtSignal
@@ -37,14 +37,33 @@ class ViewBase(QWidget):
         self._center_dialog(dialog)
         return dialog.exec_() == QMessageBox.Yes
 
-    def show_popup(self, message: str, title: str = "Processing") -> None:
+    def show_popup(
+        self,
+        message: str,
+        title: str = "Processing",
+        on_cancel: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """処理中のポップアップを表示する。on_cancel を渡すとキャンセルボタンを付ける。
+
+        表示中に呼び直したときも、ボタンとキャンセル時の処理は今回の引数に合わせる。
+        """
         if self._popup_dialog is None:
             dialog = QMessageBox(self)
             dialog.setIcon(QMessageBox.Information)
-            dialog.setWindowTitle(title)
-            dialog.setStandardButtons(QMessageBox.NoButton)
             self._popup_dialog = dialog
-        self._popup_dialog.setText(message)
+        dialog = self._popup_dialog
+        dialog.setWindowTitle(title)
+        try:
+            dialog.buttonClicked.disconnect()
+        except TypeError:
+            # まだ何も接続していない
+            pass
+        if on_cancel is None:
+            dialog.setStandardButtons(QMessageBox.NoButton)
+        else:
+            dialog.setStandardButtons(QMessageBox.Cancel)
+            dialog.buttonClicked.connect(lambda _button: on_cancel())
+        dialog.setText(message)
         self._popup_dialog.show()
 
     def close_popup(self) -> None:
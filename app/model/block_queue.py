@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import time
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+
+class BlockQueue:
+    """音声コールバックとQtスレッドをつなぐ固定長の単一生産者/単一消費者キュー。
+
+    ブロック用のスロットを事前確保しておき、生産者(PortAudioのコールバック)は
+    reserve で空きスロットを受け取って直接書き込み、commit で公開する。
+    各ブロックには先頭サンプルの取得時刻(time.monotonic)を添える。
+    消費者は drain で公開済みブロックを古い順に取り出す。書き込み位置は生産者だけ、
+    読み出し位置は消費者だけが更新し、位置はデータを書き終えてから進めるので
+    ロックは使わない。満杯のときは新しいブロックを捨てて dropped を数える。
+    """
+
+    def __init__(self, capacity: int, block_size: int, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.block_size = int(block_size)
+        self._slots = np.zeros((self.capacity, self.block_size), dtype=dtype)
+        self._lengths = np.zeros(self.capacity, dtype=np.int64)
+        self._stamps = np.zeros(self.capacity, dtype=np.float64)
+        self._head: int = 0  # 公開済みブロック数(生産者のみ更新)
+        self._tail: int = 0  # 取り出し済みブロック数(消費者のみ更新)
+        self.dropped: int = 0
+        self.overflows: int = 0
+
+    # ------------------------------------------------------------------ #
+    # 生産者側
+    # ------------------------------------------------------------------ #
+    def reserve(self) -> np.ndarray | None:
+        """次に書き込むスロットを返す。満杯なら None を返してブロックを捨てる。"""
+        if self._head - self._tail >= self.capacity:
+            self.dropped += 1
+            return None
+        return self._slots[self._head % self.capacity]
+
+    def commit(self, length: int, timestamp: float) -> None:
+        """reserve したスロットの先頭 length サンプルを取得時刻付きで公開する。"""
+        index = self._head % self.capacity
+        self._lengths[index] = min(int(length), self.block_size)
+        self._stamps[index] = timestamp
+        self._head += 1
+
+    def push(self, block: np.ndarray, timestamp: Optional[float] = None) -> bool:
+        """ブロックをコピーして公開する。捨てた場合は False を返す。"""
+        slot = self.reserve()
+        if slot is None:
+            return False
+        block = np.asarray(block).ravel()[: self.block_size]
+        slot[: block.size] = block
+        self.commit(block.size, time.monotonic() if timestamp is None else timestamp)
+        return True
+
+    def mark_overflow(self) -> None:
+        """入力デバイス側で取りこぼしが起きたことを記録する。"""
+        self.overflows += 1
+
+    # ------------------------------------------------------------------ #
+    # 消費者側
+    # ------------------------------------------------------------------ #
+    def drain(self) -> Iterator[Tuple[np.ndarray, float]]:
+        """公開済みのブロックと取得時刻を古い順に返す。
+
+        返すのはスロットのビューなので、次のブロックを受け取るまでに使い終えること。
+        """
+        while self._tail < self._head:
+            index = self._tail % self.capacity
+            yield (
+                self._slots[index, : self._lengths[index]],
+                float(self._stamps[index]),
+            )
+            self._tail += 1
+
+    def writable(self) -> bool:
+        """空きスロットがあるかを返す(最高速で再生するソースの待ち合わせ用)。"""
+        return self._head - self._tail < self.capacity
+
+    def clear(self) -> None:
+        """未処理のブロックを捨てる(消費者側から呼ぶ)。"""
+        self._tail = self._head
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self),
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+            "overflows": self.overflows,
+        }
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def __repr__(self) -> str:
+        return (
+            f"BlockQueue(pending={len(self)}, capacity={self.capacity}, "
+            f"dropped={self.dropped}, overflows={self.overflows})"
+        )
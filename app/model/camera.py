@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+Frame = Tuple[Optional[np.ndarray], Optional[float]]
+
+
+def _to_display(frame_bgr: np.ndarray) -> np.ndarray:
+    """BGRのカメラ画像を表示用の (幅, 高さ, RGB) に変換する。"""
+    return cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB).transpose((1, 0, 2))
+
+
+class FrameHistory:
+    """直近のカメラフレームを取得時刻付きで保持する上限付きリングバッファ。
+
+    compress=True ならJPEGに圧縮して保持し、メモリを数十分の一に抑える。
+    伸長と表示形式への変換は frame_at で取り出すときだけ行う。
+    """
+
+    def __init__(self, capacity: int, compress: bool = False, quality: int = 90):
+        self.capacity = int(capacity)
+        self.compress = compress
+        self.quality = int(quality)
+        self._items: Deque[Tuple[float, Union[np.ndarray, bytes]]] = deque(
+            maxlen=self.capacity
+        )
+        self._lock = threading.Lock()
+
+    def append(self, frame_bgr: np.ndarray, timestamp: float) -> None:
+        if self.compress:
+            ok, encoded = cv2.imencode(
+                ".jpg", frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+            )
+            if not ok:
+                return
+            payload: Union[np.ndarray, bytes] = encoded.tobytes()
+        else:
+            payload = frame_bgr
+        with self._lock:
+            self._items.append((timestamp, payload))
+
+    def frame_at(self, timestamp: float) -> Frame:
+        """timestamp に最も近いフレームとその取得時刻を返す。空なら (None, None)。"""
+        with self._lock:
+            if not self._items:
+                return None, None
+            stamps = np.fromiter((item[0] for item in self._items), dtype=float)
+            stamp, payload = self._items[int(np.argmin(np.abs(stamps - timestamp)))]
+        if isinstance(payload, bytes):
+            payload = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+        return _to_display(payload), float(stamp)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class CameraCapture:
+    """カメラを専用スレッドで読み続け、最新フレームだけを保持する。
+
+    読み出しとRGB変換はキャプチャースレッドで行い、変換済みのフレームと
+    取得時刻(time.monotonic)をロックで守ったスロットに上書きする。
+    Qtスレッドの latest はスロットを参照するだけなのでカメラを待たない。
+    pause 中はカメラを読まない。フレームは (幅, 高さ, 3) に転置済みで、
+    共有物なので受け取った側で書き換えないこと。
+    history を渡すと、取得したフレームを時刻付きで履歴にも積む。
+    """
+
+    def __init__(
+        self,
+        index: int = 0,
+        api: int = cv2.CAP_DSHOW,
+        fps: float = 30.0,
+        history: Optional[FrameHistory] = None,
+    ):
+        self.index = index
+        self.api = api
+        self.fps = fps
+        self.history = history
+        self.frames_captured: int = 0
+        self.read_failures: int = 0
+        self._capture: Optional[cv2.VideoCapture] = None
+        self._frame: Optional[np.ndarray] = None
+        self._timestamp: Optional[float] = None
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def resume(self) -> None:
+        """キャプチャーを開始(再開)する。初回はスレッドとデバイスを起動する。"""
+        if self._closed.is_set():
+            return
+        self._running.set()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def pause(self) -> None:
+        """キャプチャーを止める。保持している最新フレームはそのまま残す。"""
+        self._running.clear()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._running.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def latest(self) -> Frame:
+        """最新のフレームと取得時刻を返す。まだなければ (None, None)。"""
+        with self._lock:
+            return self._frame, self._timestamp
+
+    def frame_at(self, timestamp: float) -> Frame:
+        """timestamp に最も近い履歴のフレームを返す。履歴が無ければ最新を返す。"""
+        if self.history is not None:
+            frame, stamp = self.history.frame_at(timestamp)
+            if frame is not None:
+                return frame, stamp
+        return self.latest()
+
+    @property
+    def is_running(self) -> bool:
+        return self._running.is_set() and not self._closed.is_set()
+
+    def _run(self) -> None:
+        self._capture = cv2.VideoCapture(self.index, self.api)
+        interval = 1.0 / self.fps
+        try:
+            while True:
+                self._running.wait()
+                if self._closed.is_set():
+                    return
+                ok, frame = self._capture.read()
+                timestamp = time.monotonic()
+                if not ok or frame is None:
+                    # カメラが無い・外れた場合に空回りしないよう1フレーム分待つ
+                    self.read_failures += 1
+                    time.sleep(interval)
+                    continue
+                if self.history is not None:
+                    self.history.append(frame, timestamp)
+                self._store(_to_display(frame), timestamp)
+        finally:
+            self._capture.release()
+            self._capture = None
+
+    def _store(self, frame: np.ndarray, timestamp: float) -> None:
+        with self._lock:
+            self._frame = frame
+            self._timestamp = timestamp
+        self.frames_captured += 1
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class SampleClock:
+    """累積サンプル位置と取得時刻(time.monotonic)の対応を直近分だけ保持する。
+
+    ブロックが届くたびに先頭サンプルの位置と時刻を mark しておき、
+    time_of で任意のサンプル位置を含むブロックから時刻を換算する。
+    """
+
+    def __init__(self, sample_rate: int, capacity: int = 256):
+        self.sample_rate = sample_rate
+        self.capacity = int(capacity)
+        self._indices = np.zeros(self.capacity, dtype=np.int64)
+        self._stamps = np.zeros(self.capacity, dtype=np.float64)
+        self._count: int = 0
+
+    def mark(self, index: int, timestamp: float) -> None:
+        slot = self._count % self.capacity
+        self._indices[slot] = index
+        self._stamps[slot] = timestamp
+        self._count += 1
+
+    def time_of(self, index: int) -> float | None:
+        """サンプル位置 index の取得時刻を返す。対応が無ければ None。"""
+        n = min(self._count, self.capacity)
+        if n == 0:
+            return None
+        # 書き込み順に並べ直す(位置は単調増加なので二分探索できる)
+        order = np.arange(self._count - n, self._count) % self.capacity
+        indices = self._indices[order]
+        i = max(0, int(np.searchsorted(indices, index, side="right")) - 1)
+        return float(self._stamps[order[i]] + (index - indices[i]) / self.sample_rate)
+
+    def clear(self) -> None:
+        self._count = 0
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import sounddevice as sd
+
+from app.model.source import AudioCallback, AudioSource, Writable
+
+
+class SoundDeviceSource(AudioSource):
+    """sounddevice.InputStream でマイクから取り込むソース。"""
+
+    def __init__(self, model):
+        self.model = model
+        self.stream: Optional[sd.InputStream] = None
+        self._configure_defaults()
+
+    def _configure_defaults(self) -> None:
+        """sounddeviceをリセットして基本的な設定を行う。"""
+        self.reset()
+        sd.default.samplerate = self.model.sample_rate
+        sd.default.dtype = self.model.dtype
+        sd.default.blocksize = self.model.block_size
+
+    def start(self, callback: AudioCallback, writable: Optional[Writable] = None) -> None:
+        # デバイスは実時間でしか届かないので writable は使わない
+        if self.stream is not None:
+            return
+        self.stream = sd.InputStream(
+            samplerate=self.model.sample_rate,
+            blocksize=self.model.block_size,
+            dtype=self.model.dtype,
+            channels=self.model.input,
+            callback=callback,
+        )
+        self.stream.start()
+
+    def stop(self) -> None:
+        if self.stream is None:
+            return
+        self.stream.close()
+        self.stream = None
+
+    def reset(self) -> None:
+        sd._terminate()
+        sd._initialize()
+
+    @property
+    def is_active(self) -> bool:
+        return self.stream is not None and self.stream.active
@@ -1,17 +1,33 @@
 ﻿from __future__ import annotations
 
-from collections import deque
-
-import cv2
 import numpy as np
 from PyQt5.QtCore import pyqtSignal
 
 from app.base.model import ModelBase
+from app.model.camera import CameraCapture, FrameHistory
+from app.model.clock import SampleClock
 from app.model.read import Read
+from app.model.ring import RingBuffer
 from app.model.rub import RubPhase, RubSession
+from app.model.rub_features import RubFeatureExtractor
+from app.model.snapshot import SnapshotWriter
+from app.model.store import SampleStore
 from app.model.timer import Timer
 from app.model.trigger import Trigger
-from app.pipeline.pipeline import gmm, melspec_zscore
+from app.pipeline.fit_service import (
+    FitJob,
+    FitService,
+    load_pipeline_state,
+    pipeline_settings,
+)
+from app.pipeline.pipeline import (
+    gmm,
+    gmm_stream,
+    melspec_zscore,
+    rub_features,
+    stream_frame_counts,
+)
+from app.util.levels import classify
 from app.util.window import Window
 
 
@@ -37,7 +53,6 @@ class Model(ModelBase):
         self.tap_threshold_target_count: int = 30
         self.rub_train_duration_sec: float = 10
         self.rub_threshold_duration_sec: float = 10
-        self.rub_session = RubSession(train_time=float(self.rub_train_duration_sec))
         self._rub_train_elapsed: float = 0.0
         self._rub_th_elapsed: float = 0.0
 
@@ -50,15 +65,39 @@ class Model(ModelBase):
         self.input: int = 2
         self.dtype: str = "int16"
         self.block_size: int = 2048
+        # 音声コールバックからQtスレッドへ渡すキューの段数と取り出し間隔
+        self.block_queue_size: int = 32
+        self.block_drain_interval_ms: int = 10
+        # 入力ソース: "device"(マイク) / "file"(WAV・.npy再生) / "synthetic"(合成信号)
+        self.audio_source: str = "device"
+        self.audio_source_path: str | None = None
+        self.audio_source_loop: bool = False
+        self.audio_source_max_speed: bool = False
+        self.synthetic_audio_kind: str = "tap"
         self.ch: int = 0
         self.eu: float = 0.1
         self._block_data = np.array([])
         self.buffer_time: float = 1.0
         self._buffer_data = self._make_buffer()
+        self.sample_clock = SampleClock(self.sample_rate)
+        self.rub_session = self._make_rub_session()
+        self.rub_extractor: RubFeatureExtractor | None = None
 
         self.read_time: float = 0.0
         self.audio = Read(self)
+        # 異常時の撮影用に直近のカメラフレームを残す秒数(JPEG圧縮するとメモリが減る)
+        self.camera_history_sec: float = 2.0
+        self.camera_history_jpeg: bool = False
         self.camera = self._init_camera()
+        # 異常時スナップショットの保存(ワーカー数・未処理の上限・JPEG品質)
+        self.snapshot_workers: int = 2
+        self.snapshot_queue_size: int = 16
+        self.snapshot_jpeg_quality: int = 90
+        self.snapshot_writer = SnapshotWriter(
+            workers=self.snapshot_workers,
+            max_pending=self.snapshot_queue_size,
+            quality=self.snapshot_jpeg_quality,
+        )
         self.beep_duration_sec: float = 0.1
         self.beep_frequency_hz: float = 1200.0
         self.beep_volume: float = 0.2
@@ -70,23 +109,49 @@ class Model(ModelBase):
         self.bandpass_max_hz: int = 16000
         self.bandpass_pass_ripple_db: int = 3
         self.bandpass_stop_ripple_db: int = 40
+        # None: 時間領域フィルター / "butterworth", "brickwall": FFT段でマスク
+        self.spectral_band_limit: str | None = None
         self.fft_size: int = 4096
         self.fft_power: int = 2
         self.fft_window: str = "hann"
+        self.fft_fused: bool = True
         self.stft_overlap: int = int(self.fft_size * 0.75)
         self.mel_bins: int = 40
         self.mel_min_hz: int = 1000
         self.mel_max_hz: int = 16000
+        # 例: 32000 にすると各パイプラインの先頭で48kHzから間引く(Noneで無効)
+        self.decimate_sample_rate: int | None = None
 
         # トリガーと推論パイプライン
         self.trigger = Trigger(self)
         self.trigger_is_active: bool = False
         self._trigger_data = np.array([])
+        self.trigger_index: int = 0
         self.pipeline = melspec_zscore(self)
         self.n_components: int = 2
         self.covariance_type: str = "full"
         self.random_state: int = 42
+        # GMMのモデル選択: None なら上の n_components/covariance_type で1回だけ学習する。
+        # "bic" / "aic" / "heldout" なら候補を並列に学習し、規準の差が tolerance 以内なら
+        # 採点の軽いモデルを選ぶ(workers=None はCPUコア数-1)
+        self.gmm_selection: str | None = None
+        self.gmm_candidate_components: tuple = (1, 2, 3, 4, 6, 8)
+        self.gmm_candidate_covariances: tuple = ("full", "diag")
+        self.gmm_n_init: int = 3
+        self.gmm_selection_tolerance: float = 0.01
+        self.gmm_selection_workers: int | None = None
+        # warm_start を有効にすると、reset_gmm_pipeline で残した前回のGMMを次の学習の
+        # 初期値にする(成分数・共分散形式が今の設定と同じで、モデル選択が無効なときだけ)。
+        # online_update なら EMを収束まで回さず、gmm_batch_size 行ずつのオンラインEMで
+        # 足し込むだけにする。online_decay が None なら見たフレーム数で重み付け、数値なら忘却率
+        self.gmm_warm_start: bool = False
+        self.gmm_online_update: bool = False
+        self.gmm_online_decay: float | None = None
+        self.gmm_batch_size: int = 4096
+        # 学習用の常駐ワーカープロセス(起動は学習画面に入ったとき)
+        self.fit_service = FitService()
         self.gmm_pipeline = gmm(self)
+        self.gmm_stream = None
         self.gmm_is_infering: bool = False
         self.gmm_pretrained: bool = False
         self.gmm_trained: bool = False
@@ -101,8 +166,8 @@ class Model(ModelBase):
 
         # データバッファ
         self.trained: bool = False
-        self._train_data = np.empty((0, 0))
-        self._threshold_data = np.empty((0, 0))
+        self._train_data = SampleStore()
+        self._threshold_data = SampleStore()
         self.thresholded: bool = False
         self._anomaly_threshold = None
 
@@ -120,6 +185,11 @@ class Model(ModelBase):
     def reset_test_anomalies(self) -> None:
         self.test_anomalies.clear()
 
+    @property
+    def fft_bins(self) -> int:
+        """FFT/STFTで残す片側スペクトルのビン数(fs/2.56まで)。"""
+        return int(self.fft_size / 2.56) + 1
+
     @property
     def trigger_threshold(self):
         return self._trigger_threshold
@@ -144,11 +214,11 @@ class Model(ModelBase):
 
     @property
     def tap_train_sample_number(self) -> int:
-        return len(self.train_data)
+        return len(self._train_data)
 
     @property
     def tap_th_sample_number(self) -> int:
-        return len(self.threshold_data)
+        return len(self._threshold_data)
 
     @property
     def rub_train_sample_number(self) -> int:
@@ -164,23 +234,43 @@ class Model(ModelBase):
 
     @block_data.setter
     def block_data(self, value: np.ndarray):
+        # 渡されるのはキューのスロットのビューなので、保持する前にコピーする
         self._block_data = np.array(value)
+        start = self.sample_count
         self.buffer_data = self._block_data
+        self.trigger.process_block(self._block_data, start)
         if self.rub_session.is_active():
             progress = self.rub_session.append_frame(
                 self._block_data, len(self._block_data), self.sample_rate
             )
+            if self.rub_extractor is not None:
+                # セッションの配列のビューを渡す(セッションごとに確保し直すので上書きされない)
+                self.rub_extractor.push(self.rub_session.latest_frame)
             self.rub_progress.emit(progress)
 
     @property
     def buffer_data(self) -> np.ndarray:
-        if len(self._buffer_data) == 0:
-            return np.array([])
-        return np.concatenate(list(self._buffer_data))
+        """直近 buffer_time 秒の波形(リングバッファのビュー、コピーしない)。"""
+        return self._buffer_data.latest()
 
     @buffer_data.setter
     def buffer_data(self, value: np.ndarray):
-        self._buffer_data.append(value)
+        self._buffer_data.write(value)
+
+    @property
+    def sample_count(self) -> int:
+        return self._buffer_data.total
+
+    def sample_time(self, index: int) -> float | None:
+        """累積サンプル位置 index の取得時刻(time.monotonic)を返す。"""
+        return self.sample_clock.time_of(index)
+
+    def samples_since(self, count: int) -> tuple[np.ndarray, int]:
+        """countサンプル目以降に届いた音声と現在の累積サンプル数を返す。
+
+        バッファに残っていない古いサンプルは切り捨てる。
+        """
+        return self._buffer_data.since(count)
 
     def set_rub_train_elapsed(self, seconds: float):
         self._rub_train_elapsed = max(0.0, float(seconds))
@@ -188,12 +278,39 @@ class Model(ModelBase):
     def set_rub_threshold_elapsed(self, seconds: float):
         self._rub_th_elapsed = max(0.0, float(seconds))
 
-    def compute_rub_anomaly(self, signal: np.ndarray) -> float:
+    def reset_rub_stream(self) -> None:
         if self.gmm_pipeline is None:
             raise RuntimeError("GMM pipeline is not initialized.")
-        scores = self.gmm_pipeline.transform(signal)
+        self.gmm_stream = gmm_stream(self, self.gmm_pipeline)
+
+    def compute_rub_stream_anomaly(self, samples: np.ndarray) -> float | None:
+        """新しく届いたサンプルで完成したフレームの平均異常度を返す。"""
+        if self.gmm_stream is None:
+            self.reset_rub_stream()
+        # 未学習扱いの警告を避けるため、Pipeline.transformを介さず順に適用する
+        features = samples
+        for _, step in self.gmm_stream.steps[:-1]:
+            features = step.transform(features)
+        if len(features) == 0:
+            return None
+        scores = self.gmm_stream.steps[-1][1].transform(features)
         return float(np.mean(scores))
 
+    def compute_rub_features(self, frames) -> tuple[np.ndarray, np.ndarray]:
+        """取得済みブロックからライブ推論と同じフレーミングの特徴量をまとめて求める。
+
+        全ブロックを連結して各段を1回ずつ通し、各フレームは最後のサンプルが
+        届いたブロックのものとして (特徴量, ブロックごとのフレーム数) を返す。
+        """
+        sizes = np.fromiter((np.size(frame) for frame in frames), dtype=np.int64)
+        counts = stream_frame_counts(self, np.cumsum(sizes))
+        if sizes.sum() == 0:
+            return np.empty((0, self.mel_bins)), counts
+        features = np.concatenate([np.ravel(frame) for frame in frames])
+        for _, step in rub_features(self).steps:
+            features = step.transform(features)
+        return features, counts
+
     def record_rub_anomaly_score(self, score: float) -> None:
         self.rub_anomaly_scores.append(score)
         if len(self.rub_anomaly_scores) > self.rub_anomaly_history_size:
@@ -209,26 +326,20 @@ class Model(ModelBase):
         return list(self.rub_anomaly_scores[-count:])
 
     def latest_rub_anomaly_series(self, count=None):
-        scores = self.latest_rub_anomaly_scores(count)
+        """表示用の (インデックス, スコア, 段階) をそれぞれ配列で返す。
+
+        段階は 0: low未満 / 1: medium未満 / 2: それ以上。
+        """
+        scores = np.asarray(self.latest_rub_anomaly_scores(count), dtype=float)
         total = len(self.rub_anomaly_scores)
-        start = max(0, total - len(scores))
-        indices = list(range(start, start + len(scores)))
-        colors = self._colorize_rub_scores(scores)
-        return indices, scores, colors
+        start = max(0, total - scores.size)
+        indices = np.arange(start, start + scores.size, dtype=float)
+        levels = self._classify_rub_scores(scores)
+        return indices, scores, levels
 
-    def _colorize_rub_scores(self, scores):
-        if not scores:
-            return []
+    def _classify_rub_scores(self, scores: np.ndarray) -> np.ndarray:
         low, medium, _ = self.rub_threshold_offsets()
-        colors = []
-        for score in scores:
-            if score < low:
-                colors.append("#2196F3")
-            elif score < medium:
-                colors.append("#FFEB3B")
-            else:
-                colors.append("#F44336")
-        return colors
+        return classify(scores, (low, medium))
 
     def standardize_pretrain(self, score: float) -> float:
         return (score - self.pretrain_score_mean) / self._safe_std(
@@ -259,8 +370,12 @@ class Model(ModelBase):
         medium = max(sigma3 - zero_point, 0.0)
         return (low, medium, medium)
 
-    def _init_camera(self):
-        return cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    def _init_camera(self) -> CameraCapture:
+        history = FrameHistory(
+            max(1, int(self.camera_history_sec * self.fps)),
+            compress=self.camera_history_jpeg,
+        )
+        return CameraCapture(0, fps=self.fps, history=history)
 
     def time_reset(self):
         if hasattr(self, "audio") and hasattr(self.audio, "time_reset"):
@@ -268,17 +383,60 @@ class Model(ModelBase):
         else:
             self.read_time = 0
 
-    def _make_buffer(self) -> deque:
-        buffer_time = self.buffer_time
-        sample_rate = self.sample_rate
-        block_size = self.block_size
-        buffer_length = int(buffer_time * (sample_rate / block_size))
-        buffer = deque([np.full(block_size, 0)] * buffer_length, maxlen=buffer_length)
-        return buffer
+    def _make_buffer(self) -> RingBuffer:
+        return RingBuffer(int(self.buffer_time * self.sample_rate))
 
     def start_rub_collection(self, now: float, phase: RubPhase, duration: float):
+        self._cancel_rub_features()
         self.rub_session.train_time = float(duration)
         self.rub_session.start(now, phase)
+        # 収集と並行して特徴量を求め、終了後はすぐGMMの学習と採点に入れるようにする
+        self.rub_extractor = RubFeatureExtractor(rub_features(self))
+
+    def finish_rub_features(self) -> tuple[np.ndarray, np.ndarray]:
+        """収集中に求めた (特徴量, ブロックごとのフレーム数) を返す。"""
+        extractor, self.rub_extractor = self.rub_extractor, None
+        if extractor is None:
+            raise RuntimeError("Rub features were not collected.")
+        return extractor.finish()
+
+    def _cancel_rub_features(self) -> None:
+        if self.rub_extractor is not None:
+            self.rub_extractor.cancel()
+            self.rub_extractor = None
+
+    @property
+    def rub_gmm(self):
+        """gmmパイプラインのGMM段(特徴量から直接学習・採点する)。"""
+        return self.gmm_pipeline.named_steps["gmm"]
+
+    def fit_job(self, kind: str, data) -> FitJob:
+        """kind ("tap"/"rub") の学習を別プロセスで行うジョブを作る(開始はしない)。"""
+        init_state = self.rub_gmm.warm_state if kind == "rub" else None
+        return FitJob(
+            kind,
+            pipeline_settings(self),
+            data,
+            init_state=init_state,
+            service=self.fit_service,
+        )
+
+    def load_fit_state(self, kind: str, state: dict) -> None:
+        """学習プロセスが返した結果を対応するパイプラインへ書き戻す。"""
+        target = self.pipeline if kind == "tap" else self.gmm_pipeline
+        load_pipeline_state(target, state)
+
+    def score_rub_features(self, features, counts) -> list[float]:
+        """特徴量をまとめて採点し、フレームが完成したブロックごとの平均を返す。"""
+        counts = np.asarray(counts, dtype=np.int64)
+        if len(features) == 0:
+            return []
+        scores = self.rub_gmm.transform(features)
+        # フレームを1つ以上完成させたブロックごとに、区間和をまとめて求めて平均する
+        filled = counts > 0
+        starts = (np.cumsum(counts) - counts)[filled]
+        means = np.add.reduceat(scores, starts) / counts[filled]
+        return means.tolist()
 
     def stop_rub_collection(self):
         self.rub_session.stop()
@@ -299,21 +457,52 @@ class Model(ModelBase):
     def rub_buffer(self) -> np.ndarray:
         return self.rub_session.buffer
 
-    def reset_gmm_pipeline(self):
+    def reset_gmm_pipeline(self, keep_warm_start: bool = True):
+        """gmmパイプラインを作り直す。学習済みなら結果を次の学習の初期値に残す。"""
+        previous = self.rub_gmm
+        if previous.gmm_ is not None:
+            warm_state = previous.export_state()
+        else:
+            warm_state = previous.warm_state
         self.gmm_pipeline = gmm(self)
+        if keep_warm_start and warm_state is not None:
+            self.rub_gmm.warm_start_from(warm_state)
+        self.gmm_stream = None
         self.gmm_is_infering = False
         self.gmm_pretrained = False
         self.gmm_trained = False
 
     def reset_rub_session(self):
-        self.rub_session = RubSession(train_time=float(self.rub_train_duration_sec))
+        self._cancel_rub_features()
+        self.rub_session = self._make_rub_session()
+        self.rub_extractor: RubFeatureExtractor | None = None
+
+    def _make_rub_session(self) -> RubSession:
+        return RubSession(
+            train_time=float(self.rub_train_duration_sec),
+            sample_rate=self.sample_rate,
+            block_size=self.block_size,
+        )
+
+    @property
+    def camera_frame(self):
+        """最新のカメラフレームと取得時刻。まだ1枚も無ければ (None, None)。"""
+        return self.camera.latest()
+
+    def camera_frame_at(self, timestamp: float | None):
+        """timestamp に最も近い履歴のカメラフレームと取得時刻を返す。
+
+        timestamp が None なら最新のフレームを返す。
+        """
+        if timestamp is None:
+            return self.camera.latest()
+        return self.camera.frame_at(timestamp)
 
     @property
     def camera_data(self):
-        _, frame = self.camera.read()
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frame_transposed = frame_rgb.transpose((1, 0, 2))
-        return frame_transposed
+        """最新のカメラフレーム(幅, 高さ, RGB)。まだ1枚も無ければ None。"""
+        frame, _ = self.camera.latest()
+        return frame
 
     @property
     def trigger_data(self):
@@ -326,19 +515,17 @@ class Model(ModelBase):
 
     @property
     def train_data(self):
-        return self._train_data
+        """学習用に集めたトリガー波形(行ごと)のビュー。"""
+        return self._train_data.data
 
     @train_data.setter
     def train_data(self, value):
-        value = np.atleast_2d(value)
-        if self._train_data.size == 0:
-            self._train_data = value
-        else:
-            self._train_data = np.vstack((self._train_data, value))
+        # 代入は追記として扱う(1波形でも複数行でもよい)
+        self._train_data.append(value)
 
     @train_data.deleter
     def train_data(self):
-        self._train_data = np.empty((0, 0))
+        self._train_data.clear()
 
     def _generate_beep_waveform(self) -> np.ndarray:
         samples = max(1, int(self.sample_rate * self.beep_duration_sec))
@@ -354,19 +541,16 @@ class Model(ModelBase):
 
     @property
     def threshold_data(self):
-        return self._threshold_data
+        """閾値決め用に集めたトリガー波形(行ごと)のビュー。"""
+        return self._threshold_data.data
 
     @threshold_data.setter
     def threshold_data(self, value):
-        value = np.atleast_2d(value)
-        if self._threshold_data.size == 0:
-            self._threshold_data = value
-        else:
-            self._threshold_data = np.vstack((self._threshold_data, value))
+        self._threshold_data.append(value)
 
     @threshold_data.deleter
     def threshold_data(self):
-        self._threshold_data = np.empty((0, 0))
+        self._threshold_data.clear()
 
     @property
     def anomaly_threshold(self):
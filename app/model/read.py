@@ -1,59 +1,94 @@
 from __future__ import annotations
 
+import time
 from typing import Optional
 
-import sounddevice as sd
-from PyQt5.QtCore import QObject
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer
+
+from app.model.block_queue import BlockQueue
+from app.model.source import AudioSource, open_source
 
 
 class Read(QObject):
-    """入力音声ストリームを管理し、取得サンプルをモデルへ渡す。"""
+    """入力音声ソースを管理し、取得サンプルをモデルへ渡す。
+
+    入力は model.audio_source で選んだ AudioSource (マイク・ファイル再生・
+    合成信号)から同じコールバック形式で届く。
+    コールバックはブロックを BlockQueue へ書き込むだけにして、
+    モデルへの受け渡し(バッファ書き込み・トリガー検出・擦り収集)は
+    Qtスレッドのタイマーでキューを取り出して行う。
+    """
 
     def __init__(self, model):
         super().__init__()
         self.model = model
-        self.stream: Optional[sd.InputStream] = None
+        self.source: Optional[AudioSource] = None
         self.time = 0.0
+        self.queue = self._make_queue()
+        self.drain_timer = QTimer(self)
+        self.drain_timer.timeout.connect(self.drain)
         self.model.audio_is_stream = False
         self.model.camera_is_stream = False
-        self._configure_defaults()
+        self.set_source(open_source(self.model))
+
+    def set_source(self, source: AudioSource) -> None:
+        """入力ソースを差し替える。取り込み中なら止めてから差し替える。"""
+        was_streaming = self.model.audio_is_stream
+        self.stop()
+        self.source = source
+        if was_streaming:
+            self.start()
 
-    def _configure_defaults(self) -> None:
-        """sounddeviceをリセットして基本的な設定を行う。"""
-        self.reset()
-        sd.default.samplerate = self.model.sample_rate
-        sd.default.dtype = self.model.dtype
-        sd.default.blocksize = self.model.block_size
+    def reload_source(self) -> None:
+        """model.audio_source の設定からソースを作り直す。"""
+        self.set_source(open_source(self.model))
+
+    def _make_queue(self) -> BlockQueue:
+        return BlockQueue(self.model.block_queue_size, self.model.block_size)
 
     def start(self) -> None:
         if self.model.audio_is_stream:
             return
-        self.stream = sd.InputStream(
-            samplerate=self.model.sample_rate,
-            blocksize=self.model.block_size,
-            dtype=self.model.dtype,
-            channels=self.model.input,
-            callback=self.callback,
-        )
-        self.stream.start()
+        if self.queue.block_size != self.model.block_size:
+            self.queue = self._make_queue()
+        else:
+            self.queue.clear()
+        self.source.start(self.callback, self.queue.writable)
+        self.drain_timer.start(self.model.block_drain_interval_ms)
         self.model.audio_is_stream = True
 
     def stop(self) -> None:
-        if not self.model.audio_is_stream or self.stream is None:
+        if not self.model.audio_is_stream or self.source is None:
             return
-        self.stream.close()
-        self.stream = None
+        self.source.stop()
+        self.drain_timer.stop()
+        self.drain()
         self.model.audio_is_stream = False
 
-    def callback(self, indata, frames, _time, _status) -> None:
-        data = indata[:, self.model.ch] * self.model.eu
-        self.time += frames / self.model.sample_rate
-        self.model.read_time = self.time
-        self.model.block_data = data.copy()
+    def callback(self, indata, frames, _time, status) -> None:
+        # 音声スレッド: 確保済みスロットへ換算しながら書き込むだけで、確保もシグナルもしない
+        if status.input_overflow:
+            self.queue.mark_overflow()
+        slot = self.queue.reserve()
+        if slot is None:
+            return
+        n = min(frames, slot.size)
+        np.multiply(indata[:n, self.model.ch], self.model.eu, out=slot[:n])
+        # コールバックはブロックが揃ってから呼ばれるので、先頭サンプルの時刻は1ブロック前
+        self.queue.commit(n, time.monotonic() - frames / self.model.sample_rate)
+
+    def drain(self) -> None:
+        """キューに溜まったブロックを順にモデルへ渡す(Qtスレッドから呼ぶ)。"""
+        for block, timestamp in self.queue.drain():
+            self.time += block.size / self.model.sample_rate
+            self.model.read_time = self.time
+            self.model.sample_clock.mark(self.model.sample_count, timestamp)
+            self.model.block_data = block
 
     def reset(self) -> None:
-        sd._terminate()
-        sd._initialize()
+        if self.source is not None:
+            self.source.reset()
 
     def time_reset(self) -> None:
         self.time = 0.0
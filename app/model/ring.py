@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class RingBuffer:
+    """事前確保した連続配列に音声を書き込むリングバッファ。
+
+    配列を2周分確保し、同じサンプルを2か所へ書き込むので、直近Nサンプルは
+    常に連続した領域になりコピーなしのビューで返せる。書き込みは1スレッド
+    (音声側)だけが行い、累積サンプル数はデータを書き終えてから進めるので
+    読み出し側はロックなしで参照できる。ただし読み出したビューは、容量分の
+    サンプルが書き込まれるまでに使い終えること。
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=dtype)
+        self._count: int = 0
+
+    @property
+    def total(self) -> int:
+        """これまでに書き込んだ累積サンプル数。"""
+        return self._count
+
+    def write(self, block: np.ndarray) -> None:
+        block = np.asarray(block).ravel()
+        n = block.size
+        if n == 0:
+            return
+        count = self._count
+        cap = self.capacity
+        if n > cap:
+            count += n - cap
+            block = block[-cap:]
+            n = cap
+
+        pos = count % cap
+        first = min(n, cap - pos)
+        data = self._data
+        data[pos : pos + first] = block[:first]
+        data[cap + pos : cap + pos + first] = block[:first]
+        rest = n - first
+        if rest:
+            data[:rest] = block[first:]
+            data[cap : cap + rest] = block[first:]
+        self._count = count + n
+
+    def latest(self, n: int | None = None) -> np.ndarray:
+        """直近nサンプル(省略時は容量分)のビューを返す。"""
+        return self._view(self._count, n)
+
+    def since(self, count: int) -> tuple[np.ndarray, int]:
+        """累積count以降に書き込まれたサンプルのビューと現在の累積数を返す。
+
+        容量を超えて取りこぼした古いサンプルは切り捨てる。
+        """
+        total = self._count
+        return self._view(total, total - count), total
+
+    def segment(self, start: int, stop: int) -> np.ndarray:
+        """累積位置 start から stop までのビューを返す。
+
+        まだ書き込まれていない範囲と、既に上書きされた範囲は含めない。
+        """
+        total = self._count
+        cap = self.capacity
+        stop = min(int(stop), total)
+        start = max(int(start), total - cap, 0)
+        if stop <= start:
+            return self._data[:0]
+        end = total % cap + cap - (total - stop)
+        return self._data[end - (stop - start) : end]
+
+    def _view(self, total: int, n: int | None) -> np.ndarray:
+        cap = self.capacity
+        n = cap if n is None else max(0, min(int(n), cap))
+        end = total % cap + cap
+        return self._data[end - n : end]
+
+    def clear(self) -> None:
+        self._data[:] = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self.capacity
@@ -14,19 +14,34 @@ class RubPhase(Enum):
 
 @dataclass
 class RubSession:
-    """単一の転がしトレーニングセッションを管理する状態コンテナー。"""
+    """単一の転がしトレーニングセッションを管理する状態コンテナー。
+
+    start で train_time 秒分(とブロックの余裕)の配列を確保し、届いた
+    ブロックはそこへ直接書き込む。buffer と frames はこの配列のビューを
+    返すのでコピーしない。配列はセッションごとに確保し直すので、渡した
+    ビューは次の start 以降も書き換わらない。
+    """
 
     train_time: float
-    data: List[np.ndarray] = field(default_factory=list)
+    sample_rate: int = 48000
+    block_size: int = 2048
     counting_time: float = 0.0
     collecting: bool = False
     start_ts: Optional[float] = None
     end_ts: Optional[float] = None
     phase: Optional[RubPhase] = None
+    _samples: np.ndarray = field(default_factory=lambda: np.empty(0), repr=False)
+    _size: int = field(default=0, repr=False)
+    _bounds: List[int] = field(default_factory=list, repr=False)
 
     def start(self, now: float, phase: RubPhase) -> None:
         """指定フェーズの擦りフレーム収集を開始する。"""
-        self.data.clear()
+        # 終了はタイマーで判定するので、遅れて届く数ブロック分を余分に確保する
+        capacity = int(np.ceil(self.train_time * self.sample_rate))
+        capacity += 4 * self.block_size
+        self._samples = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+        self._bounds = [0]
         self.counting_time = 0.0
         self.collecting = True
         self.start_ts = now
@@ -40,8 +55,17 @@ class RubSession:
         self.end_ts = None
 
     def append_frame(self, frame: np.ndarray, frames: int, sample_rate: int) -> float:
-        """マイクから取得したフレームを保存する。"""
-        self.data.append(frame.copy())
+        """マイクから取得したフレームを確保済みの配列へ書き込む。"""
+        frame = np.asarray(frame).ravel()
+        end = self._size + frame.size
+        if end > self._samples.size:
+            # 想定より長く届いた場合だけ倍に広げる
+            grown = np.empty(max(end, 2 * self._samples.size), dtype=np.float64)
+            grown[: self._size] = self._samples[: self._size]
+            self._samples = grown
+        self._samples[self._size : end] = frame
+        self._size = end
+        self._bounds.append(end)
         self.counting_time += frames / float(sample_rate)
         return self.counting_time
 
@@ -58,10 +82,18 @@ class RubSession:
 
     @property
     def buffer(self) -> np.ndarray:
-        if not self.data:
+        if self._size == 0:
             return np.empty(0, dtype=np.float32)
-        return np.concatenate(tuple(self.data))
+        return self._samples[: self._size]
+
+    @property
+    def latest_frame(self) -> np.ndarray:
+        """最後に書き込んだブロックのビュー。"""
+        if len(self._bounds) < 2:
+            return self._samples[:0]
+        return self._samples[self._bounds[-2] : self._bounds[-1]]
 
     @property
     def frames(self) -> Tuple[np.ndarray, ...]:
-        return tuple(self.data)
+        bounds = self._bounds
+        return tuple(self._samples[a:b] for a, b in zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.model.store import SampleStore
+
+
+class RubFeatureExtractor:
+    """擦り収集中に届いたブロックを別スレッドで特徴量(メルスペクトル)へ変換する。
+
+    pipeline にはストリーミングの前段・STFT・メルを並べたものを渡す。
+    ブロックは push した順にワーカースレッドで変換し、特徴量の行と
+    ブロックごとに完成したフレーム数を貯める。finish は残りを処理し終えるのを
+    待ってから結果を返すので、収集終了後の待ち時間は最後の数ブロック分で済む。
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.features = SampleStore()
+        self.frame_counts: list[int] = []
+        self.error: Optional[Exception] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def push(self, block: np.ndarray) -> None:
+        """ブロックを変換待ちに積む。ブロックは変換が終わるまで書き換えないこと。"""
+        self._queue.put(block)
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray]:
+        """変換を終えて (特徴量, ブロックごとのフレーム数) を返す。"""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Rub feature extraction failed: {self.error}")
+        return self.features.data, np.asarray(self.frame_counts, dtype=np.int64)
+
+    def cancel(self) -> None:
+        """結果を待たずに終了させる。"""
+        self._queue.put(None)
+
+    def _run(self) -> None:
+        # 未学習扱いの警告を避けるため、Pipeline.transformを介さず順に適用する
+        steps = [step for _, step in self.pipeline.steps]
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                features = block
+                for step in steps:
+                    features = step.transform(features)
+                self.features.append(features)
+                self.frame_counts.append(len(features))
+            except Exception as exc:
+                self.error = exc
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+
+class SnapshotWriter:
+    """異常時のカメラ画像をバックグラウンドでJPEG保存するライタープール。
+
+    submit はフレームと付帯情報を受け取ってすぐ戻り、変換・エンコード・
+    書き込みはワーカースレッドで行う。未処理が max_pending 件に達している
+    ときは新しい依頼を捨てて dropped を数える。ファイル名の連番はフォルダーごとに
+    メモリ上で数えるので、保存のたびにファイルの存在を確かめない。
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, quality: int = 90):
+        self.max_pending = int(max_pending)
+        self.quality = int(quality)
+        self.pending: int = 0
+        self.dropped: int = 0
+        self.written: int = 0
+        self.failed: int = 0
+        self.last_error: Optional[str] = None
+        self._counters: Dict[Path, int] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="snapshot"
+        )
+
+    def submit(
+        self,
+        frame: np.ndarray,
+        folder,
+        anomaly: float,
+        when: Optional[datetime] = None,
+    ) -> bool:
+        """(幅, 高さ, RGB) のフレームを保存キューに積む。捨てた場合は False を返す。"""
+        folder = Path(folder)
+        when = datetime.now() if when is None else when
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending += 1
+            index = self._next_index(folder)
+        filename = f"{when:%Y%m%d%H%M%S}_{anomaly:.2f}_{index:04d}.jpg"
+        # フレームは共有物なのでワーカーでは読むだけにする
+        self._executor.submit(self._write, frame, folder / filename)
+        return True
+
+    def take_error(self) -> Optional[str]:
+        """前回以降に起きた保存エラーを返して消去する。無ければ None。"""
+        with self._lock:
+            error, self.last_error = self.last_error, None
+        return error
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "dropped": self.dropped,
+                "written": self.written,
+                "failed": self.failed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _next_index(self, folder: Path) -> int:
+        # フォルダーを初めて使うときだけ既存の枚数を数え、以降はメモリ上で進める
+        if folder not in self._counters:
+            self._counters[folder] = (
+                sum(1 for _ in folder.glob("*.jpg")) if folder.exists() else 0
+            )
+        index = self._counters[folder]
+        self._counters[folder] = index + 1
+        return index
+
+    def _write(self, frame: np.ndarray, path: Path) -> None:
+        try:
+            bgr = cv2.cvtColor(frame.transpose((1, 0, 2)), cv2.COLOR_RGB2BGR)
+            ok, encoded = cv2.imencode(
+                ".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+            )
+            if not ok:
+                raise RuntimeError(f"Failed to encode snapshot {path.name}.")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # cv2.imwrite は日本語を含むパスに書けないので、エンコード結果を直接書く
+            path.write_bytes(encoded.tobytes())
+        except Exception as exc:
+            with self._lock:
+                self.failed += 1
+                self.last_error = f"Failed to save snapshot to {path}: {exc}"
+        else:
+            with self._lock:
+                self.written += 1
+        finally:
+            with self._lock:
+                self.pending -= 1
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from scipy.io import wavfile
+
+# sounddevice の InputStream と同じ (indata, frames, time, status) で呼ぶ
+AudioCallback = Callable[[np.ndarray, int, object, "SourceStatus"], None]
+Writable = Callable[[], bool]
+
+
+@dataclass
+class SourceStatus:
+    """sounddevice.CallbackFlags のうち Read が参照する項目だけを持つ状態。"""
+
+    input_overflow: bool = False
+
+
+class AudioSource(ABC):
+    """音声ブロックをコールバックで届ける入力の共通インターフェース。
+
+    start で受け取った callback を sounddevice.InputStream と同じ引数で呼ぶ。
+    indata は (frames, model.input) の配列で、値は model.dtype の生の値
+    (int16なら-32768〜32767)とする。writable は消費側に空きがあるかを返し、
+    最高速で再生するソースはこれが True になるまで次のブロックを待つ。
+    """
+
+    @abstractmethod
+    def start(self, callback: AudioCallback, writable: Optional[Writable] = None) -> None:
+        """ブロックの送り出しを始める。"""
+
+    @abstractmethod
+    def stop(self) -> None:
+        """ブロックの送り出しを止める。"""
+
+    def reset(self) -> None:
+        """入力デバイスを初期化し直す。デバイスを持たないソースでは何もしない。"""
+
+    @property
+    @abstractmethod
+    def is_active(self) -> bool:
+        """ブロックを送り出している間 True を返す。"""
+
+
+class _ThreadedSource(AudioSource):
+    """生成したブロックを専用スレッドから実時間または最高速で届けるソースの基底。"""
+
+    def __init__(self, model, max_speed: bool = False):
+        self.model = model
+        self.max_speed = max_speed
+        self.blocks_sent: int = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+
+    def start(self, callback: AudioCallback, writable: Optional[Writable] = None) -> None:
+        if self.is_active:
+            return
+        self._stop.clear()
+        self._finished.clear()
+        self.rewind()
+        self._thread = threading.Thread(
+            target=self._run, args=(callback, writable), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """最後のブロックを送り終えるまで待つ。終わっていれば True を返す。"""
+        return self._finished.wait(timeout)
+
+    @property
+    def is_active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def rewind(self) -> None:
+        """先頭から送り直す準備をする。"""
+
+    @abstractmethod
+    def next_block(self, frames: int) -> Optional[np.ndarray]:
+        """(frames, channels) のブロックを返す。終端なら None を返す。"""
+
+    def _run(self, callback: AudioCallback, writable: Optional[Writable]) -> None:
+        frames = self.model.block_size
+        period = frames / float(self.model.sample_rate)
+        status = SourceStatus()
+        deadline = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                block = self.next_block(frames)
+                if block is None:
+                    break
+                if self.max_speed:
+                    # 消費側が追いつくまで待つ(取りこぼしなしで処理能力を測る)
+                    while writable is not None and not writable():
+                        if self._stop.wait(0.0005):
+                            return
+                else:
+                    deadline += period
+                    delay = deadline - time.perf_counter()
+                    if delay > 0 and self._stop.wait(delay):
+                        return
+                callback(block, len(block), None, status)
+                self.blocks_sent += 1
+        finally:
+            self._finished.set()
+
+    def _as_channels(self, data: np.ndarray) -> np.ndarray:
+        """モノラルは入力チャンネル数へ複製し、(samples, channels) にそろえる。"""
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data[:, None]
+        channels = self.model.input
+        if data.shape[1] < channels:
+            data = np.tile(data[:, :1], (1, channels))
+        return np.ascontiguousarray(data[:, :channels])
+
+
+class FileSource(_ThreadedSource):
+    """WAVファイルまたはNumPy配列を入力として再生するソース。
+
+    WAVのサンプリング周波数が model.sample_rate と違う場合はエラーにする。
+    浮動小数のWAVは model.dtype の整数レンジへ換算する。loop=True なら
+    終端で先頭に戻る。max_speed=True なら実時間を待たずに送る。
+    """
+
+    def __init__(self, model, data, max_speed: bool = False, loop: bool = False):
+        super().__init__(model, max_speed=max_speed)
+        self.loop = loop
+        self.data = self._as_channels(self._load(data))
+        self._pos: int = 0
+
+    def _load(self, data) -> np.ndarray:
+        if isinstance(data, (str, Path)):
+            path = Path(data)
+            if path.suffix.lower() == ".npy":
+                return np.load(path)
+            fs, samples = wavfile.read(path)
+            if fs != self.model.sample_rate:
+                raise ValueError(
+                    f"{path.name}: {fs} Hz (expected {self.model.sample_rate} Hz)"
+                )
+            if np.issubdtype(samples.dtype, np.floating):
+                dtype = np.dtype(self.model.dtype)
+                if np.issubdtype(dtype, np.integer):
+                    samples = samples * np.iinfo(dtype).max
+            return samples
+        return np.asarray(data)
+
+    def rewind(self) -> None:
+        self._pos = 0
+
+    def next_block(self, frames: int) -> Optional[np.ndarray]:
+        total = len(self.data)
+        if total == 0:
+            return None
+        if self._pos >= total:
+            if not self.loop:
+                return None
+            self._pos = 0
+        block = self.data[self._pos : self._pos + frames]
+        self._pos += frames
+        if len(block) < frames:
+            # 端数のブロックもデバイスと同じ長さにそろえる
+            block = np.concatenate(
+                (block, np.zeros((frames - len(block), block.shape[1])))
+            )
+        return block
+
+    @property
+    def duration(self) -> float:
+        return len(self.data) / float(self.model.sample_rate)
+
+
+class SyntheticSource(_ThreadedSource):
+    """叩きまたは擦りを模した信号を生成するソース。
+
+    kind="tap" は tap_interval 秒ごとに減衰する共振音を、kind="rub" は
+    ゆっくり振幅の変わる帯域雑音を背景雑音に重ねる。値は model.dtype の
+    生の値で、amplitude と noise_level もその単位で指定する。
+    duration=None なら停止するまで生成し続ける。
+    """
+
+    def __init__(
+        self,
+        model,
+        kind: str = "tap",
+        duration: Optional[float] = None,
+        max_speed: bool = False,
+        tap_interval: float = 0.5,
+        amplitude: float = 500.0,
+        noise_level: float = 5.0,
+        seed: int = 0,
+    ):
+        super().__init__(model, max_speed=max_speed)
+        if kind not in ("tap", "rub"):
+            raise ValueError(f"unknown synthetic kind: {kind}")
+        self.kind = kind
+        self.duration = duration
+        self.tap_interval = tap_interval
+        self.amplitude = amplitude
+        self.noise_level = noise_level
+        self.seed = seed
+        self.rewind()
+
+    def rewind(self) -> None:
+        self._pos = 0
+        self._rng = np.random.default_rng(self.seed)
+        self._tap = self._tap_waveform()
+
+    def _tap_waveform(self) -> np.ndarray:
+        fs = float(self.model.sample_rate)
+        t = np.arange(int(0.08 * fs)) / fs
+        tone = np.sin(2 * np.pi * 3000 * t) + 0.5 * np.sin(2 * np.pi * 7100 * t)
+        return self.amplitude * np.exp(-t * 60) * tone
+
+    def next_block(self, frames: int) -> Optional[np.ndarray]:
+        fs = float(self.model.sample_rate)
+        start = self._pos
+        if self.duration is not None:
+            frames = min(frames, int(self.duration * fs) - start)
+            if frames <= 0:
+                return None
+        index = np.arange(start, start + frames)
+        block = self.noise_level * self._rng.standard_normal(frames)
+        if self.kind == "tap":
+            block += self._taps(index, fs)
+        else:
+            block += self._rub(index, fs)
+        self._pos += frames
+        return self._as_channels(block)
+
+    def _taps(self, index: np.ndarray, fs: float) -> np.ndarray:
+        period = max(1, int(self.tap_interval * fs))
+        out = np.zeros(index.size)
+        tap = self._tap
+        # ブロックにかかる叩きの開始位置(period の倍数)ごとに波形を重ねる
+        first = max(0, (int(index[0]) - tap.size + 1 + period - 1) // period)
+        for onset in range(first * period, int(index[-1]) + 1, period):
+            lo = max(onset, int(index[0]))
+            hi = min(onset + tap.size, int(index[-1]) + 1)
+            if lo < hi:
+                out[lo - index[0] : hi - index[0]] += tap[lo - onset : hi - onset]
+        return out
+
+    def _rub(self, index: np.ndarray, fs: float) -> np.ndarray:
+        t = index / fs
+        noise = self._rng.standard_normal(index.size)
+        # 1次差分で高域を強調した雑音を 0.7 Hz でゆっくり変調する
+        noise = np.diff(noise, prepend=0.0)
+        envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 0.7 * t)
+        return 0.2 * self.amplitude * envelope * noise
+
+
+def open_source(model) -> AudioSource:
+    """model.audio_source の設定に対応する入力ソースを作る。
+
+    "device": マイク(sounddevice) / "file": model.audio_source_path を再生 /
+    "synthetic": model.synthetic_audio_kind の合成信号。
+    """
+    kind = model.audio_source
+    if kind == "device":
+        # sounddevice はマイクを使うときだけ読み込む
+        from app.model.device import SoundDeviceSource
+
+        return SoundDeviceSource(model)
+    if kind == "file":
+        return FileSource(
+            model,
+            model.audio_source_path,
+            max_speed=model.audio_source_max_speed,
+            loop=model.audio_source_loop,
+        )
+    if kind == "synthetic":
+        return SyntheticSource(
+            model,
+            kind=model.synthetic_audio_kind,
+            max_speed=model.audio_source_max_speed,
+        )
+    raise ValueError(f"unknown audio source: {kind}")
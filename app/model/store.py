@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class SampleStore:
+    """同じ長さのサンプルを行として追記していく可変長の2次元配列。
+
+    容量が足りなくなったら倍に広げるので追記は償却O(1)で、data は
+    追記済みの行だけを指すビューをコピーなしで返す。列数は空の状態からの
+    最初の追記で決まり、違う長さのサンプルを追記すると ValueError にする。
+    空の追記は無視する。data のビューは次の追記で古くなることがある。
+    """
+
+    def __init__(self, dtype=np.float64, capacity: int = 32):
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = max(1, int(capacity))
+        self._data = np.empty((0, 0), dtype=self.dtype)
+        self._count: int = 0
+
+    def append(self, value) -> None:
+        rows = np.atleast_2d(np.asarray(value, dtype=self.dtype))
+        if rows.size == 0:
+            return
+        rows = rows.reshape(rows.shape[0], -1)
+        n, width = rows.shape
+        if self._count == 0 and width != self._data.shape[1]:
+            capacity = max(self.initial_capacity, n)
+            self._data = np.empty((capacity, width), dtype=self.dtype)
+        elif width != self._data.shape[1]:
+            raise ValueError(
+                f"sample length {width} does not match stored length "
+                f"{self._data.shape[1]}"
+            )
+        self._reserve(self._count + n)
+        self._data[self._count : self._count + n] = rows
+        self._count += n
+
+    def _reserve(self, size: int) -> None:
+        capacity = self._data.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        grown = np.empty((capacity, self._data.shape[1]), dtype=self.dtype)
+        grown[: self._count] = self._data[: self._count]
+        self._data = grown
+
+    @property
+    def data(self) -> np.ndarray:
+        """追記済みの行のビュー。未追記なら (0, 0) の配列。"""
+        if self._count == 0:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self._data[: self._count]
+
+    def clear(self) -> None:
+        """中身を空にする。確保済みの領域は列数が同じ次の追記で使い回す。"""
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
@@ -1,82 +1,105 @@
 from __future__ import annotations
 
-from typing import Iterable, Sequence
+from collections import deque
 
 import numpy as np
 from PyQt5.QtCore import QObject
 
 
 class Trigger(QObject):
-    """設定した閾値を超えたときの音声フレームを切り出すユーティリティ。"""
+    """設定した閾値を超えたときの音声フレームを切り出すユーティリティ。
+
+    検出は音声ブロックが届くたびに process_block で行い、閾値を超えた
+    サンプル位置をそのまま記録する。ヒット後 hold 秒(サンプル数換算)は
+    次のヒットを受け付けない。切り出しに必要な後続サンプルが揃ったヒットは
+    キューに積まれ、Qtスレッドの trigger() がまとめて取り出して通知する。
+    Qtスレッドが遅れて未通知のヒットが max_pending_hits 件に達したときは
+    新しいヒットを捨てて dropped_hits を数える(BlockQueue.dropped と同じ扱い)。
+    """
 
     def __init__(self, model):
         super().__init__()
         self.model = model
-        self.buffer_index: int = -5
         self.hold: float = 0.05
         self.offset: int = -1024
         self.length: int = 4096
+        self.max_pending_hits: int = 64
+        self._last_hit: int | None = None
+        self._pending: deque[int] = deque()
+        self.dropped_hits: int = 0
+        self._hits: deque[tuple[int, np.ndarray]] = deque()
 
     def trigger(self) -> None:
-        if not self._should_trigger():
-            return
-
-        self.model.time_reset()
-        buffer_segments = self._buffer_segments()
-        if not buffer_segments:
-            return
-
-        trigger_data = self._extract_trigger_data(np.concatenate(buffer_segments))
-        self.model.trigger_data = trigger_data
+        """切り出し済みのヒットを古い順に通知する(Qtスレッドから呼ぶ)。"""
+        while self._hits:
+            index, trigger_data = self._hits.popleft()
+            self.model.trigger_index = index
+            self.model.trigger_data = trigger_data
+
+    def process_block(self, block: np.ndarray, start: int) -> None:
+        """累積位置 start から始まるブロックを検査し、ヒットを登録する。
+
+        ブロックはリングバッファへ書き込み済みであること。
+        """
+        if self.is_active and self.height is not None:
+            self._detect(np.asarray(block), start)
+        if self._pending:
+            self._collect()
 
     def start(self) -> None:
         self.model.trigger_is_active = True
 
     def stop(self) -> None:
         self.model.trigger_is_active = False
+        self._pending.clear()
+        self._hits.clear()
 
-    # ------------------------------------------------------------------ #
-    # 内部処理
-    # ------------------------------------------------------------------ #
-    def _buffer_segments(self) -> Sequence[np.ndarray]:
-        buffer_data = getattr(self.model, "_buffer_data", None)
-        if buffer_data is None:
-            return []
-        segments = list(buffer_data)
-        if not segments:
-            return []
-        start = max(0, len(segments) + self.buffer_index - 1)
-        return segments[start:]
-
-    def _should_trigger(self) -> bool:
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending) + len(self._hits),
+            "capacity": self.max_pending_hits,
+            "dropped": self.dropped_hits,
+        }
+
+    def __repr__(self) -> str:
         return (
-            self.is_active
-            and self.height is not None
-            and self._is_threshold_exceeded()
-            and self.model.read_time >= self.hold
+            f"Trigger(pending={len(self._pending) + len(self._hits)}, "
+            f"capacity={self.max_pending_hits}, dropped={self.dropped_hits})"
         )
 
-    def _is_threshold_exceeded(self) -> bool:
-        buffer_data = getattr(self.model, "_buffer_data", None)
-        if buffer_data is None:
-            return False
-        segments = list(buffer_data)
-        if not segments:
-            return False
-        index = self.buffer_index
-        try:
-            return np.any(segments[index] >= self.height)
-        except IndexError:
-            return False
-
-    def _extract_trigger_data(self, data: np.ndarray) -> np.ndarray:
-        threshold_indices = np.where(data >= self.height)[0]
-        if threshold_indices.size == 0:
-            return np.empty(0, dtype=data.dtype)
-        index = int(threshold_indices[0])
-        start = max(0, index + self.offset)
-        end = start + self.length
-        return data[start:end]
+    # ------------------------------------------------------------------ #
+    # 内部処理
+    # ------------------------------------------------------------------ #
+    def _detect(self, block: np.ndarray, start: int) -> None:
+        above = np.flatnonzero(block >= self.height)
+        if above.size == 0:
+            return
+        hold = self.hold_samples
+        last = self._last_hit
+        i = 0
+        if last is not None:
+            i = int(np.searchsorted(above, last + hold - start))
+        while i < above.size:
+            last = start + int(above[i])
+            self._pending.append(last)
+            i = int(np.searchsorted(above, last + hold - start))
+        self._last_hit = last
+
+    def _collect(self) -> None:
+        ring = self.model._buffer_data
+        total = ring.total
+        while self._pending:
+            index = self._pending[0]
+            begin = max(0, index + self.offset)
+            end = begin + self.length
+            if end > total:
+                return
+            self._pending.popleft()
+            if len(self._hits) >= self.max_pending_hits:
+                self.dropped_hits += 1
+                continue
+            # リングバッファのビューは上書きされるので切り出した窓はコピーして渡す
+            self._hits.append((index, ring.segment(begin, end).copy()))
 
     # ------------------------------------------------------------------ #
     # 便利プロパティ
@@ -88,3 +111,7 @@ class Trigger(QObject):
     @property
     def height(self) -> float | None:
         return getattr(self.model, "trigger_threshold", None)
+
+    @property
+    def hold_samples(self) -> int:
+        return max(1, int(round(self.hold * self.model.sample_rate)))
@@ -2,14 +2,31 @@ import numpy as np
 from scipy import signal
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from app.pipeline.cache import artifacts
+
 
 class BandPassFilter(BaseEstimator, TransformerMixin):
-    def __init__(self, model):
+    """二次セクション(SOS)形式のバターワース帯域通過フィルター。
+
+    streaming=False ではゼロ位相の sosfiltfilt を使い、オフライン学習向けに
+    入力全体をまとめて処理する。streaming=True では因果的な sosfilt を使い、
+    フィルター状態(zi)をブロック間で引き継ぐので各サンプルは一度だけ処理される。
+    """
+
+    def __init__(self, model, streaming=False):
         self.model = model
-        self.b, self.a = self._design_filter()
+        self.streaming = streaming
+        self._zi = None
 
     def _design_filter(self):
         fn = self.fs / 2
+        if self.f_max * 1.5 > fn:
+            # 間引き後などで上側の阻止域がナイキストを超える場合は、
+            # 高域側はリサンプラーの帯域制限に任せてHPFだけを設計する
+            N, Wn = signal.buttord(
+                self.f_min / fn, self.f_min / 2 / fn, self.g_pass, self.g_stop
+            )
+            return signal.butter(N, Wn, "highpass", output="sos")
         fp = np.array([self.f_min, self.f_max])
         fs = np.array([self.f_min / 2, self.f_max * 1.5])
         wp = fp / fn
@@ -17,8 +34,9 @@ class BandPassFilter(BaseEstimator, TransformerMixin):
         N, Wn = signal.buttord(wp, ws, self.g_pass, self.g_stop)
         # バターワースではゲインを触らず、次数とカットオフで決める
         # LPFとHPFを分けるにしてもNの数は把握しておきたい
-        b, a = signal.butter(N, Wn, "band")
-        return b, a
+        # 高次でも数値的に安定するよう(b, a)ではなくSOSで持つ
+        sos = signal.butter(N, Wn, "band", output="sos")
+        return sos
 
     def fit(self, X, y=None):
         return self
@@ -26,10 +44,38 @@ class BandPassFilter(BaseEstimator, TransformerMixin):
     def transform(self, X):
         return self._bandpass(X)
 
+    def reset(self):
+        self._zi = None
+
     def _bandpass(self, x):
-        y = signal.filtfilt(self.b, self.a, x)
+        if self.streaming:
+            return self._bandpass_stream(x)
+        y = signal.sosfiltfilt(self.sos, x)
         return y
 
+    def _bandpass_stream(self, x):
+        x = np.asarray(x, dtype=float).ravel()
+        if x.size == 0:
+            return x
+        if self._zi is None:
+            # 最初のサンプルで定常状態から始め、立ち上がりの過渡応答を抑える
+            self._zi = self.sos_zi * x[0]
+        y, self._zi = signal.sosfilt(self.sos, x, zi=self._zi)
+        return y
+
+    @property
+    def sos(self):
+        return artifacts.get(self._key("bandpass_sos"), self._design_filter)
+
+    @property
+    def sos_zi(self):
+        return artifacts.get(
+            self._key("bandpass_sos_zi"), lambda: signal.sosfilt_zi(self.sos)
+        )
+
+    def _key(self, name):
+        return (name, self.fs, self.f_min, self.f_max, self.g_pass, self.g_stop)
+
     @property
     def fs(self):
         return self.model.sample_rate
@@ -49,3 +95,30 @@ class BandPassFilter(BaseEstimator, TransformerMixin):
     @property
     def g_stop(self):
         return self.model.bandpass_stop_ripple_db
+
+
+def spectral_mask(model, n_fft, n_bins):
+    """FFT段で帯域制限するときの各ビンの振幅ゲインを返す。
+
+    model.spectral_band_limit が "butterworth" なら時間領域の sosfiltfilt と
+    同じ振幅特性 |H(f)|**2 を、"brickwall" なら通過帯域だけ1の矩形マスクを返す。
+    未設定ならNoneを返し、時間領域のフィルターを使う。
+    """
+    kind = model.spectral_band_limit
+    if not kind:
+        return None
+    bandpass = BandPassFilter(model)
+    key = bandpass._key("spectral_mask") + (kind, n_fft, n_bins)
+    return artifacts.get(key, lambda: _design_mask(bandpass, kind, n_fft, n_bins))
+
+
+def _design_mask(bandpass, kind, n_fft, n_bins):
+    freqs = np.arange(n_bins) * bandpass.fs / n_fft
+    if kind == "butterworth":
+        _, h = signal.sosfreqz(bandpass.sos, worN=freqs, fs=bandpass.fs)
+        # filtfiltは同じフィルターを往復で2回かけるので振幅は|H|**2になる
+        return np.abs(h) ** 2
+    if kind == "brickwall":
+        inside = (freqs >= bandpass.f_min) & (freqs <= bandpass.f_max)
+        return inside.astype(float)
+    raise ValueError(f"Unknown spectral band limit: {kind}")
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class ArtifactCache:
+    """フィルター係数・窓関数・メルフィルタバンクなどを共有する上限付きLRUキャッシュ。
+
+    キーにはサンプリング周波数やFFTサイズなど設計に使ったパラメーターを並べた
+    タプルを使う。同じパラメーターのパイプラインを作り直しても再設計は行わず、
+    既存の配列を共有する。返した配列は共有物なので呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        # 設計処理は重いことがあるのでロックの外で行う
+        value = factory()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        stats = self.stats()
+        return (
+            "ArtifactCache(hits={hits}, misses={misses}, "
+            "size={size}/{maxsize})".format(**stats)
+        )
+
+
+artifacts = ArtifactCache()
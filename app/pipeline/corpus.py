@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+from scipy.io import wavfile
+
+from app.pipeline.gmm import GMM
+from app.pipeline.pipeline import rub_features
+
+_DATA_FILE = "features.bin"
+_META_FILE = "corpus.json"
+
+
+class FeatureCorpus:
+    """擦りの特徴量(メルスペクトル)をディスク上に書きためるコーパス。
+
+    特徴量は1つのバイナリーファイルへ行単位で追記し、読み出しは np.memmap で行う。
+    行数と次元は corpus.json に保存する。append も chunks も扱うのは渡された分と
+    1チャンク分だけなので、コーパスの大きさに関係なくメモリ使用量は一定になる。
+    """
+
+    def __init__(self, path, n_features: int, dtype=np.float32, rows: int = 0):
+        self.path = Path(path)
+        self.n_features = int(n_features)
+        self.dtype = np.dtype(dtype)
+        self.rows = int(rows)
+
+    @classmethod
+    def create(cls, path, n_features: int, dtype=np.float32) -> "FeatureCorpus":
+        """空のコーパスを作る。同じ場所の既存のコーパスは上書きする。"""
+        corpus = cls(path, n_features, dtype)
+        corpus.path.mkdir(parents=True, exist_ok=True)
+        corpus._data_path.write_bytes(b"")
+        corpus._write_meta()
+        return corpus
+
+    @classmethod
+    def open(cls, path) -> "FeatureCorpus":
+        path = Path(path)
+        meta = json.loads((path / _META_FILE).read_text(encoding="utf-8"))
+        return cls(path, meta["n_features"], meta["dtype"], meta["rows"])
+
+    def append(self, features: np.ndarray) -> None:
+        """(フレーム数, 次元) の特徴量を末尾に追記する。"""
+        features = np.asarray(features)
+        if features.size == 0:
+            return
+        if features.ndim != 2 or features.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected features with {self.n_features} columns, "
+                f"got shape {features.shape}."
+            )
+        with self._data_path.open("ab") as file:
+            file.write(np.ascontiguousarray(features, dtype=self.dtype).tobytes())
+        self.rows += len(features)
+        self._write_meta()
+
+    @property
+    def features(self) -> np.ndarray:
+        """全行の読み取り専用 memmap(行を参照したときだけディスクから読む)。"""
+        if self.rows == 0:
+            return np.empty((0, self.n_features), dtype=self.dtype)
+        return np.memmap(
+            self._data_path,
+            dtype=self.dtype,
+            mode="r",
+            shape=(self.rows, self.n_features),
+        )
+
+    def chunks(
+        self, batch_size: int, rng: Optional[np.random.Generator] = None
+    ) -> Iterator[np.ndarray]:
+        """batch_size 行ずつ float64 に読み出す。rng を渡すとチャンクの順番を混ぜる。"""
+        features = self.features
+        starts = np.arange(0, self.rows, int(batch_size))
+        if rng is not None:
+            starts = rng.permutation(starts)
+        for start in starts:
+            yield np.asarray(features[start : start + batch_size], dtype=np.float64)
+
+    def sample(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """重複なしに size 行を無作為に選んで float64 で返す。"""
+        size = min(int(size), self.rows)
+        index = np.sort(rng.choice(self.rows, size=size, replace=False))
+        return np.asarray(self.features[index], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __repr__(self) -> str:
+        return (
+            f"FeatureCorpus(path={str(self.path)!r}, rows={self.rows}, "
+            f"n_features={self.n_features}, dtype={self.dtype.name})"
+        )
+
+    @property
+    def _data_path(self) -> Path:
+        return self.path / _DATA_FILE
+
+    def _write_meta(self) -> None:
+        meta = {
+            "n_features": self.n_features,
+            "dtype": self.dtype.name,
+            "rows": self.rows,
+        }
+        (self.path / _META_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+
+def extract_corpus(
+    model,
+    recordings: Iterable,
+    path,
+    block_size: Optional[int] = None,
+) -> FeatureCorpus:
+    """録音から擦りの特徴量を求めて、path にコーパスとして書き出す。
+
+    recordings の要素は1次元の波形(model.eu を掛けた換算済みの値)か、
+    .npy / .wav のパス。ファイルは FileSource で再生するものと同じ生の値として
+    メモリマップで開き、多チャンネルなら model.ch を選んで model.eu を掛ける
+    (浮動小数のWAVは先に model.dtype の整数レンジへ換算する)。録音ごとに
+    ストリーミングの前段を作り直し、block_size サンプル(既定は1秒)ずつ
+    通して追記するので、長い録音も全体をメモリに載せない。
+    """
+    block_size = int(block_size or model.sample_rate)
+    corpus = FeatureCorpus.create(path, model.mel_bins)
+    for recording in recordings:
+        samples = _load_recording(model, recording)
+        # 未学習扱いの警告を避けるため、Pipeline.transformを介さず順に適用する
+        steps = [step for _, step in rub_features(model).steps]
+        for start in range(0, len(samples), block_size):
+            features = np.asarray(samples[start : start + block_size], dtype=float)
+            for step in steps:
+                features = step.transform(features)
+            corpus.append(features)
+    return corpus
+
+
+def fit_corpus(
+    model,
+    corpus: FeatureCorpus,
+    batch_size: Optional[int] = None,
+    max_passes: int = 5,
+    tol: float = 1e-3,
+    init_rows: int = 20000,
+    init_state: Optional[dict] = None,
+) -> GMM:
+    """コーパスをチャンクずつ流すミニバッチEMでGMMを学習する。
+
+    初期値は init_rows 行の無作為抽出に通常の fit(モデル選択やウォームスタートも
+    含む)をかけて作る。その後はパスごとにチャンクの順番を混ぜて partial_fit し、
+    抽出した行の平均対数尤度の変化が tol (相対) を下回ったら打ち切る。
+    返す GMM は model.gmm_pipeline の GMM 段と同じ型なので、
+    model.load_fit_state("rub", {"gmm": gmm.export_state()}) でそのまま使える。
+    """
+    if len(corpus) == 0:
+        raise ValueError("Feature corpus is empty.")
+    batch_size = int(batch_size or model.gmm_batch_size)
+    rng = np.random.default_rng(model.random_state)
+    sample = corpus.sample(init_rows, rng)
+
+    gmm = GMM(model)
+    if init_state is not None:
+        gmm.warm_start_from(init_state)
+    gmm.fit(sample)
+    previous = gmm.gmm_.score(sample)
+    for _ in range(max_passes):
+        # 前のパスの統計量は1チャンク分の重みだけ残し、最初のチャンクで崩れないようにする
+        gmm.start_pass(batch_size)
+        for chunk in corpus.chunks(batch_size, rng):
+            gmm.partial_fit(chunk, log=False)
+        score = gmm.gmm_.score(sample)
+        converged = abs(score - previous) <= tol * max(abs(previous), 1.0)
+        previous = score
+        if converged:
+            break
+    gmm.n_seen_ = len(corpus)
+    gmm.record_fit(sample, "corpus")
+    return gmm
+
+
+def _load_recording(model, recording) -> np.ndarray:
+    if not isinstance(recording, (str, Path)):
+        samples = np.asarray(recording)
+        if samples.ndim != 1:
+            raise ValueError(
+                f"Expected a 1-D converted waveform, got shape {samples.shape}."
+            )
+        return samples
+    path = Path(recording)
+    if path.suffix.lower() == ".npy":
+        samples = np.load(path, mmap_mode="r")
+        if samples.ndim > 1:
+            samples = samples[:, model.ch]
+        return _Scaled(samples, model.eu)
+    fs, samples = wavfile.read(path, mmap=True)
+    if fs != model.sample_rate:
+        raise ValueError(f"{path.name}: {fs} Hz (expected {model.sample_rate} Hz)")
+    if samples.ndim > 1:
+        samples = samples[:, model.ch]
+    scale = model.eu
+    if np.issubdtype(samples.dtype, np.floating):
+        dtype = np.dtype(model.dtype)
+        if np.issubdtype(dtype, np.integer):
+            scale = scale * np.iinfo(dtype).max
+    return _Scaled(samples, scale)
+
+
+class _Scaled:
+    """メモリマップした波形を、切り出したときだけ倍率を掛けて返すビュー。"""
+
+    def __init__(self, samples: np.ndarray, scale: float):
+        self.samples = samples
+        self.scale = scale
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, index) -> np.ndarray:
+        return np.asarray(self.samples[index], dtype=float) * self.scale
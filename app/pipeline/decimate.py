@@ -0,0 +1,135 @@
+from fractions import Fraction
+
+import numpy as np
+from scipy import fft, signal
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from app.pipeline.cache import artifacts
+
+
+class Decimate(BaseEstimator, TransformerMixin):
+    """取り込みレートから model.decimate_sample_rate へ多相フィルターで間引く。
+
+    streaming=False では scipy.signal.resample_poly で入力全体を変換する。
+    streaming=True では同じFIRを因果的にかけ、ブロック間で入力の履歴と
+    出力位相を引き継ぐので、ブロック長が間引き比で割り切れなくてもよい。
+    """
+
+    def __init__(self, model, streaming=False):
+        self.model = model
+        self.streaming = streaming
+        self.reset()
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        if self.streaming:
+            return self._decimate_stream(X)
+        return self._decimate(X)
+
+    def reset(self):
+        self._history = np.empty(0)
+        self._offset = 0
+        self._next = 0
+
+    def _decimate(self, x):
+        up, down = self.ratio
+        # 設計済みのFIRを渡し、呼び出しごとの firwin 設計を省く
+        return signal.resample_poly(
+            np.asarray(x, dtype=float), up, down, axis=-1, window=self.taps
+        )
+
+    def _decimate_stream(self, x):
+        up, down = self.ratio
+        h = self.taps * up
+        x = np.asarray(x, dtype=float).ravel()
+        buf = np.concatenate((self._history, x)) if self._history.size else x
+        if buf.size == 0:
+            return buf
+        end = self._offset + buf.size
+
+        # 出力jは入力を up 倍にした列の j*down 番目までで計算できる
+        last = ((end - 1) * up) // down
+        first_local = self._next - self._offset * up // down
+        y = signal.upfirdn(h, buf, up, down)
+        out = y[first_local : first_local + (last - self._next + 1)]
+        self._next = last + 1
+
+        # 次の出力に必要な入力だけを残す。位相を揃えるため down の倍数で切る
+        need = -(-(self._next * down - h.size + 1) // up)
+        keep_from = max(self._offset, (max(need, 0) // down) * down)
+        self._history = buf[keep_from - self._offset :].copy()
+        self._offset = keep_from
+        return out
+
+    @property
+    def ratio(self):
+        frac = Fraction(
+            int(self.model.decimate_sample_rate), int(self.model.sample_rate)
+        )
+        return frac.numerator, frac.denominator
+
+    @property
+    def taps(self):
+        up, down = self.ratio
+        return artifacts.get(("decimate_fir", up, down), lambda: _design_taps(up, down))
+
+
+def _design_taps(up, down):
+    # resample_poly の既定(kaiser, beta=5.0)と同じ設計
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    return signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+
+class DecimatedModel:
+    """間引き後のレートで各段のパラメーターを読み替えるモデルのビュー。
+
+    FFTサイズとSTFTのホップは時間長がほぼ保たれるように換算するので、
+    周波数分解能(Hz/ビン)とトリガー窓の時間長は間引き前とほぼ変わらない。
+    トリガー窓は取り込みレートのまま切り出し、間引き段で自動的に短くなる。
+    ここで上書きしない属性は元のモデルの値をそのまま返す。
+    """
+
+    def __init__(self, model):
+        self.base = model
+
+    def __getattr__(self, name):
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    @property
+    def factor(self) -> float:
+        return self.base.decimate_sample_rate / self.base.sample_rate
+
+    @property
+    def sample_rate(self) -> int:
+        return int(self.base.decimate_sample_rate)
+
+    @property
+    def fft_size(self) -> int:
+        # 換算した長さのままだと素数になりFFTが遅くなるので、高速な長さへ切り上げる
+        n = int(round(self.base.fft_size * self.factor))
+        return fft.next_fast_len(n, real=True)
+
+    @property
+    def stft_overlap(self) -> int:
+        hop = self.base.fft_size - self.base.stft_overlap
+        return self.fft_size - max(1, int(round(hop * self.factor)))
+
+    @property
+    def fft_bins(self) -> int:
+        # 取り込み時のAD変換の余裕(1/2.56)はリサンプラーの帯域制限で確保済みなので、
+        # 解析に使う上限周波数までのビンを残す
+        f_max = max(self.base.mel_max_hz, self.base.bandpass_max_hz)
+        bins = int(np.ceil(f_max * self.fft_size / self.sample_rate)) + 1
+        return min(bins, self.fft_size // 2 + 1)
+
+
+def analysis_model(model):
+    """間引きが有効なら DecimatedModel を、無効なら元のモデルを返す。"""
+    if model.decimate_sample_rate:
+        return DecimatedModel(model)
+    return model
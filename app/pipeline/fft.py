@@ -1,6 +1,9 @@
 import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from app.pipeline.bandpass import spectral_mask
+from app.pipeline.cache import artifacts
+
 
 class FastFourierTransform(BaseEstimator, TransformerMixin):
     def __init__(self, model):
@@ -16,12 +19,15 @@ class FastFourierTransform(BaseEstimator, TransformerMixin):
         if x.ndim == 1:
             x = x.reshape(1, -1)
 
-        win = np.hanning(x.shape[-1])
+        win = hanning(x.shape[-1])
         data = x * win
         spec = np.fft.rfft(a=data, n=self.n_fft, norm="forward")[:, : self.f_range]
         spec /= np.mean(win)
         spec = np.abs(spec) ** self.power
         spec[:, 1:] *= 2
+        mask = spectral_mask(self.model, self.n_fft, self.f_range)
+        if mask is not None:
+            spec *= mask**self.power
         return spec
 
     @property
@@ -38,4 +44,8 @@ class FastFourierTransform(BaseEstimator, TransformerMixin):
 
     @property
     def f_range(self):
-        return int(self.n_fft / 2.56) + 1
+        return self.model.fft_bins
+
+
+def hanning(n):
+    return artifacts.get(("hanning", n), lambda: np.hanning(n))
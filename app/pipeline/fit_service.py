@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import atexit
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import numpy as np
+
+# 子プロセスでパイプラインを組み立て直すのに必要な設定(Modelの属性名)
+PIPELINE_SETTINGS = (
+    "sample_rate",
+    "decimate_sample_rate",
+    "spectral_band_limit",
+    "bandpass_min_hz",
+    "bandpass_max_hz",
+    "bandpass_pass_ripple_db",
+    "bandpass_stop_ripple_db",
+    "fft_size",
+    "fft_bins",
+    "fft_power",
+    "fft_window",
+    "fft_fused",
+    "stft_overlap",
+    "mel_bins",
+    "mel_min_hz",
+    "mel_max_hz",
+    "n_components",
+    "covariance_type",
+    "random_state",
+    "gmm_selection",
+    "gmm_candidate_components",
+    "gmm_candidate_covariances",
+    "gmm_n_init",
+    "gmm_selection_tolerance",
+    "gmm_selection_workers",
+    "gmm_warm_start",
+    "gmm_online_update",
+    "gmm_online_decay",
+    "gmm_batch_size",
+)
+
+# tap: 打音の生波形から melspec_zscore を学習する
+# rub: 擦りの特徴量(メルスペクトル)から GMM 段だけを学習する
+KINDS = ("tap", "rub")
+
+
+class FitCancelled(Exception):
+    """学習が取り消されたことを表す。"""
+
+
+def pipeline_settings(model) -> dict:
+    """model から子プロセスへ渡す設定を取り出す(値だけの辞書)。"""
+    return {name: getattr(model, name) for name in PIPELINE_SETTINGS}
+
+
+def load_pipeline_state(pipeline, state: dict) -> None:
+    """子プロセスが返した段ごとの学習結果を pipeline の同名の段へ書き戻す。"""
+    for name, step_state in state.items():
+        pipeline.named_steps[name].load_state(step_state)
+
+
+class FitService:
+    """学習用のワーカープロセスを1つ起動したままにして、学習ジョブを順に処理させる。
+
+    spawn でのプロセス起動と sklearn などの読み込みには数秒かかるので、
+    プロセスは最初の start(または submit)で1度だけ起動し、以降のジョブで使い回す。
+    学習の画面に入ったときに start しておけば、最初の学習も起動を待たない。
+    EMの途中で取り消しに応じないときはプロセスを止め、次のジョブで起動し直す。
+    候補選択でプロセスプールを使えるよう daemon にはせず、終了時に atexit で片付ける。
+    """
+
+    def __init__(self):
+        self._context = mp.get_context("spawn")
+        self._tasks = None
+        self._messages = None
+        self._cancel = None
+        self._process = None
+        self._next_id: int = 0
+        atexit.register(self.close)
+
+    def start(self) -> None:
+        """ワーカープロセスが動いていなければ起動する(すぐ戻る)。"""
+        if self.is_running:
+            return
+        context = self._context
+        self._tasks = context.Queue()
+        self._messages = context.Queue()
+        self._cancel = context.Event()
+        self._process = context.Process(
+            target=_serve_forever,
+            args=(self._tasks, self._messages, self._cancel),
+            name="fit-service",
+        )
+        self._process.start()
+
+    def submit(self, kind, settings, memory_name, shape, init_state) -> int:
+        """ジョブを送り、結果の受け取りに使う番号を返す。"""
+        self.start()
+        self._cancel.clear()
+        self._next_id += 1
+        self._tasks.put(
+            (self._next_id, kind, settings, memory_name, shape, init_state)
+        )
+        return self._next_id
+
+    def request_cancel(self) -> None:
+        if self._cancel is not None:
+            self._cancel.set()
+
+    def next_message(self, job_id: int, timeout: float) -> Optional[tuple]:
+        """job_id のメッセージを1つ返す。timeout までに無ければ None。
+
+        取り消したジョブの古いメッセージは読み捨てる。プロセスが落ちていたら
+        RuntimeError を送出する。
+        """
+        try:
+            message = self._messages.get(timeout=timeout)
+        except queue.Empty:
+            if not self.is_running:
+                exitcode = None if self._process is None else self._process.exitcode
+                self._process = None
+                raise RuntimeError(
+                    f"Fit process exited unexpectedly (exit code {exitcode})."
+                )
+            return None
+        if message[0] != job_id:
+            return None
+        return message[1:]
+
+    def restart(self) -> None:
+        """応答しないワーカープロセスを止める。次の submit で起動し直す。"""
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def close(self, grace: float = 1.0) -> None:
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._tasks.put(None)
+            self._process.join(grace)
+        self.restart()
+
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+
+class FitJob:
+    """melspec_zscore / GMM の学習を別プロセスで行う1回分のジョブ。
+
+    学習データは共有メモリに1度だけ書き、子プロセスはそれをコピーせずに読む。
+    子プロセスは段ごとに ("progress", 段番号, 段数, 段名) を、最後に
+    ("result", 段ごとの学習結果) か ("error", メッセージ) を返す。
+    学習結果は各段の export_state が返す配列だけの辞書なので、推定器そのものを
+    送るより小さい。取り消しはまず段の切れ目での終了を頼み、cancel_grace 秒
+    待っても応じないときはプロセスを止める。init_state を渡すと rub の GMM は
+    その学習結果から始める(ウォームスタート/オンライン更新)。
+
+    service を渡すとその常駐プロセスで学習する。渡さなければジョブ専用の
+    プロセスを起動して終わったら止めるが、spawn の起動とライブラリーの読み込みで
+    毎回3秒近くかかる(打音の学習自体は数十ミリ秒)ので、アプリでは
+    Model.fit_service を使い回す。
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        settings: dict,
+        data,
+        init_state: Optional[dict] = None,
+        service: Optional[FitService] = None,
+        cancel_grace: float = 1.0,
+    ):
+        if kind not in KINDS:
+            raise ValueError(f"unknown fit kind: {kind}")
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.size == 0:
+            raise ValueError("No training data to fit.")
+        self.kind = kind
+        self.settings = dict(settings)
+        self.init_state = init_state
+        self.shape = data.shape
+        self.cancel_grace = float(cancel_grace)
+        self._data = data
+        self._owns_service = service is None
+        self._service = FitService() if service is None else service
+        self._memory: Optional[shared_memory.SharedMemory] = None
+        self._job_id: Optional[int] = None
+        self._cancel_requested = False
+
+    def start(self) -> None:
+        self._memory = shared_memory.SharedMemory(create=True, size=self._data.nbytes)
+        shared = np.ndarray(self.shape, dtype=np.float64, buffer=self._memory.buf)
+        shared[...] = self._data
+        del shared
+        self._data = None
+        self._job_id = self._service.submit(
+            self.kind, self.settings, self._memory.name, self.shape, self.init_state
+        )
+
+    def wait(
+        self,
+        on_progress: Optional[Callable[[int, int, str], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        poll_interval: float = 0.1,
+    ) -> dict:
+        """学習が終わるまで待って段ごとの学習結果を返す。
+
+        取り消されたら FitCancelled を、子プロセスで失敗したら RuntimeError を送出する。
+        """
+        service = self._service
+        deadline = None
+        try:
+            while True:
+                cancelling = self._cancel_requested or (
+                    should_cancel is not None and should_cancel()
+                )
+                if cancelling and deadline is None:
+                    service.request_cancel()
+                    deadline = time.monotonic() + self.cancel_grace
+                if deadline is not None and time.monotonic() > deadline:
+                    # EMの途中で応じないので止める(次のジョブで起動し直す)
+                    service.restart()
+                    raise FitCancelled("Fitting was cancelled.")
+                message = service.next_message(self._job_id, poll_interval)
+                if message is None:
+                    continue
+                kind = message[0]
+                if kind == "progress":
+                    if on_progress is not None and deadline is None:
+                        on_progress(*message[1:])
+                elif deadline is not None or kind == "cancelled":
+                    # 取り消しを頼んだ後に届いた結果は使わない
+                    raise FitCancelled("Fitting was cancelled.")
+                elif kind == "result":
+                    return message[1]
+                else:
+                    raise RuntimeError(message[1])
+        finally:
+            self.close()
+
+    def cancel(self) -> None:
+        """取り消しを頼む。wait がそれを受けてプロセスへ伝える。"""
+        self._cancel_requested = True
+
+    def close(self) -> None:
+        """共有メモリを解放する。専用プロセスを使ったときはそれも止める。"""
+        if self._owns_service:
+            self._service.close(self.cancel_grace)
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+
+def _serve_forever(tasks, messages, cancel) -> None:
+    """常駐プロセスの入口。ジョブを受け取っては学習し、None で終わる。"""
+    # 最初のジョブで待たせないよう、学習で使うモジュールを先に読み込んでおく
+    import app.pipeline.gmm  # noqa: F401
+    import app.pipeline.pipeline  # noqa: F401
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, kind, settings, memory_name, shape, init_state = task
+        _serve(job_id, kind, settings, memory_name, shape, init_state, messages, cancel)
+
+
+def _serve(
+    job_id, kind, settings, memory_name, shape, init_state, messages, cancel
+) -> None:
+    """共有メモリの学習データで1つのジョブを学習し、結果を job_id 付きで返す。"""
+
+    def send(*message):
+        messages.put((job_id,) + message)
+
+    try:
+        memory = shared_memory.SharedMemory(name=memory_name)
+    except Exception as exc:
+        send("error", f"{type(exc).__name__}: {exc}")
+        return
+    try:
+        data = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        try:
+            state = _fit(
+                kind, SimpleNamespace(**settings), data, init_state, send, cancel
+            )
+        except FitCancelled:
+            send("cancelled")
+            return
+        except Exception as exc:
+            send("error", f"{type(exc).__name__}: {exc}")
+            return
+        finally:
+            # 共有メモリを閉じる前にビューを手放す
+            del data
+        send("result", state)
+    finally:
+        memory.close()
+
+
+def _fit(kind, settings, data, init_state, send, cancel) -> dict:
+    from app.pipeline.gmm import GMM
+    from app.pipeline.pipeline import melspec_zscore
+
+    if kind == "rub":
+        gmm = GMM(settings)
+        if init_state is not None:
+            gmm.warm_start_from(init_state)
+        steps = [("gmm", gmm)]
+    else:
+        steps = list(melspec_zscore(settings).steps)
+
+    # 未学習扱いの警告を避けるため、Pipeline.fitを介さず順に適用する
+    X = data
+    for index, (name, step) in enumerate(steps):
+        if cancel.is_set():
+            raise FitCancelled()
+        send("progress", index, len(steps), name)
+        if index < len(steps) - 1:
+            X = step.fit(X).transform(X)
+        else:
+            step.fit(X)
+    return {
+        name: step.export_state()
+        for name, step in steps
+        if hasattr(step, "export_state")
+    }
@@ -0,0 +1,106 @@
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from app.pipeline.bandpass import spectral_mask
+from app.pipeline.cache import artifacts
+from app.pipeline.fft import hanning
+from app.pipeline.mel import Mel
+
+
+class FusedMelSpectrum(BaseEstimator, TransformerMixin):
+    """FastFourierTransform → Mel を1回のrfftと1回の行列積にまとめた変換。
+
+    振幅の正規化(norm="forward" と窓平均)、片側スペクトルの2倍、周波数領域の
+    帯域制限マスク、メル射影は事前に1つの射影行列へ畳み込んでおく。作業用バッファは行数ごとに使い回す。
+    出力は FastFourierTransform → Mel と同じ値になる。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._workspace = None
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return self._melspec(X)
+
+    def _melspec(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+
+        n_rows, n_samples = x.shape
+        frames, spec, power, out = self._buffers(n_rows, n_samples)
+        np.multiply(x, hanning(n_samples), out=frames)
+        np.fft.rfft(frames, n=self.n_fft, axis=-1, out=spec)
+        self._power(spec[:, : self.f_range], power)
+        np.matmul(power, self._projection(n_samples), out=out)
+        return out.copy()
+
+    def _power(self, spec, out):
+        p = self.power
+        if p == 2:
+            # |Z|**2 を sqrt を経由せずに実部・虚部の二乗和で求める
+            pairs = spec.view(np.float64).reshape(spec.shape + (2,))
+            np.einsum("ijk,ijk->ij", pairs, pairs, out=out)
+        else:
+            np.abs(spec, out=out)
+            if p not in (None, 1):
+                np.power(out, p, out=out)
+        return out
+
+    def _projection(self, n_samples):
+        key = (
+            "fused_mel",
+            self.model.sample_rate,
+            self.n_fft,
+            self.f_range,
+            n_samples,
+            self.power,
+            self.model.mel_bins,
+            self.model.mel_min_hz,
+            self.model.mel_max_hz,
+            self.model.spectral_band_limit,
+            self.model.bandpass_min_hz,
+            self.model.bandpass_max_hz,
+            self.model.bandpass_pass_ripple_db,
+            self.model.bandpass_stop_ripple_db,
+        )
+        return artifacts.get(key, lambda: self._design_projection(n_samples))
+
+    def _design_projection(self, n_samples):
+        p = 1 if self.power is None else self.power
+        amplitude = 1.0 / (self.n_fft * np.mean(hanning(n_samples)))
+        scale = np.full(self.f_range, amplitude**p)
+        scale[1:] *= 2
+        mask = spectral_mask(self.model, self.n_fft, self.f_range)
+        if mask is not None:
+            scale *= mask**p
+        melfb = Mel(self.model).melfb.toarray()
+        return np.ascontiguousarray((melfb * scale).T)
+
+    def _buffers(self, n_rows, n_samples):
+        n_mels = self.model.mel_bins
+        shape = (n_rows, n_samples, self.n_fft, self.f_range, n_mels)
+        if self._workspace is None or self._workspace[0] != shape:
+            buffers = (
+                np.empty((n_rows, n_samples)),
+                np.empty((n_rows, self.n_fft // 2 + 1), dtype=np.complex128),
+                np.empty((n_rows, self.f_range)),
+                np.empty((n_rows, n_mels)),
+            )
+            self._workspace = (shape, buffers)
+        return self._workspace[1]
+
+    @property
+    def n_fft(self):
+        return self.model.fft_size
+
+    @property
+    def power(self):
+        return self.model.fft_power
+
+    @property
+    def f_range(self):
+        return self.model.fft_bins
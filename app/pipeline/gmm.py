@@ -1,44 +1,233 @@
 import numpy as np
+from scipy import linalg
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.mixture import GaussianMixture
 
+from app.pipeline.gmm_select import select_mixture
+
 
 class GMM(BaseEstimator, TransformerMixin):
     def __init__(self, model):
         self.model = model
         self.gmm_ = None
+        self.scorer_ = None
+        self.candidates_ = []
+        self.n_seen_ = 0
+        self._stats = None
+        self._warm_state = None
         self._logp_mean = None
         self._logp_std = None
 
+    def warm_start_from(self, state: dict) -> None:
+        """次の fit の初期値にする学習結果(export_state の辞書)を覚えておく。"""
+        self._warm_state = state
+
+    @property
+    def warm_state(self):
+        return self._warm_state
+
     def fit(self, X, y=None):
-        X = np.asarray(X)
+        X = np.asarray(X, dtype=np.float64)
         if X.ndim == 1:
             X = X[np.newaxis, :]
 
-        self.gmm_ = GaussianMixture(
-            n_components=self.model.n_components,
-            covariance_type=self.model.covariance_type,
-            random_state=self.model.random_state,
+        warm = self._usable_warm_state(X)
+        self._stats = None
+        self.n_seen_ = 0
+        if warm is not None and self.model.gmm_online_update:
+            # 前回の分布から始め、ミニバッチのオンラインEMで新しいデータを足し込む
+            self.load_state(warm)
+            self._partial_fit(X)
+            self.record_fit(X, "online")
+            return self
+        if warm is not None:
+            # 前回の重み・平均・精度を初期値にEMを回す(k-means初期化を省く)
+            self.gmm_ = GaussianMixture(
+                n_components=len(warm["weights"]),
+                covariance_type=warm["covariance_type"],
+                random_state=self.model.random_state,
+                weights_init=warm["weights"],
+                means_init=warm["means"],
+                precisions_init=_precisions(
+                    warm["precisions_cholesky"], warm["covariance_type"]
+                ),
+            )
+            self.gmm_.fit(X)
+        elif self.model.gmm_selection:
+            self.gmm_, self.candidates_ = self._select(X)
+        else:
+            self.gmm_ = GaussianMixture(
+                n_components=self.model.n_components,
+                covariance_type=self.model.covariance_type,
+                random_state=self.model.random_state,
+            )
+            self.gmm_.fit(X)
+        self.n_seen_ = len(X)
+        self.scorer_ = FastGMMScorer.from_mixture(self.gmm_)
+        self.record_fit(X, "warm" if warm is not None else "full")
+        return self
+
+    def partial_fit(self, X, y=None, log=True):
+        """ミニバッチのオンラインEMで、学習済みの分布へ新しいデータを足し込む。
+
+        未学習なら warm_start_from の結果から始め、それも無ければ通常の fit を行う。
+        X は model.gmm_batch_size 行ずつに分けて更新するので、長い録音を
+        少しずつ渡せば全体をメモリに載せずに学習できる。
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if self.gmm_ is None:
+            warm = self._usable_warm_state(X)
+            if warm is None:
+                return self.fit(X)
+            self.load_state(warm)
+        self._partial_fit(X)
+        if log:
+            self.record_fit(X, "online")
+        return self
+
+    def start_pass(self, prior_frames: int) -> None:
+        """データ全体を何度も流すときに、新しいパスを始める。
+
+        ここまでの十分統計量は prior_frames フレーム分の重みとして残し、
+        以降の partial_fit はそれに対して見たフレーム数で重み付けする。
+        """
+        if self.gmm_ is None:
+            raise RuntimeError("GMM must be fitted before starting a pass.")
+        if self._stats is None:
+            self._stats = _stats_from_mixture(self.gmm_)
+        self.n_seen_ = int(prior_frames)
+
+    def _partial_fit(self, X):
+        if self._stats is None:
+            self._stats = _stats_from_mixture(self.gmm_)
+        batch = max(1, int(self.model.gmm_batch_size))
+        for start in range(0, len(X), batch):
+            self._online_step(X[start : start + batch])
+        self.scorer_ = FastGMMScorer.from_mixture(self.gmm_)
+
+    def _online_step(self, X):
+        """1バッチ分のEステップと十分統計量の更新、Mステップを行う。
+
+        十分統計量は1フレームあたりの平均 (Σγ, Σγx, Σγx²) で持つ。
+        model.gmm_online_decay が None なら、これまでに見たフレーム数で重み付けした
+        累積平均(全データで1回EMを回したのに近い)、数値なら忘却率として
+        新しいバッチをその割合で混ぜる(現場の変化に追従させたいとき)。
+        """
+        mixture = self.gmm_
+        n = len(X)
+        resp = mixture.predict_proba(X)
+        batch = _batch_stats(X, resp, mixture.covariance_type)
+
+        decay = self.model.gmm_online_decay
+        eta = float(decay) if decay else n / (self.n_seen_ + n)
+        self._stats = tuple(
+            (1.0 - eta) * old + eta * new for old, new in zip(self._stats, batch)
         )
-        self.gmm_.fit(X)
+        self.n_seen_ += n
+        _set_parameters(mixture, *_maximize(self._stats, mixture))
 
+    def _usable_warm_state(self, X):
+        """ウォームスタートに使える前回の結果を返す。
+
+        モデル選択が有効なら構造は選択で決めるので使わない。成分数・共分散形式が
+        今の設定と違うとき、特徴量の次元が違うときも使わない。
+        """
+        warm = self._warm_state
+        if warm is None or not self.model.gmm_warm_start or self.model.gmm_selection:
+            return None
+        means = np.asarray(warm["means"])
+        if (
+            len(means) != self.model.n_components
+            or warm["covariance_type"] != self.model.covariance_type
+            or means.shape[1] != X.shape[1]
+            or len(means) > len(X)
+        ):
+            return None
+        return warm
+
+    def record_fit(self, X, mode):
+        """X の対数尤度の平均と標準偏差を学習時の統計として記録し、表示する。"""
         logp_train = self.gmm_.score_samples(X)
         self._logp_mean = float(logp_train.mean())
         self._logp_std = float(logp_train.std() + 1e-8)
         converged = getattr(self.gmm_, "converged_", None)
         n_iter = getattr(self.gmm_, "n_iter_", None)
         print(
-            "[GMM Fit] shape={}, components={}, converged={}, iter={}, "
-            "logp_mean={:.3f}, logp_std={:.3f}".format(
+            "[GMM Fit] mode={}, shape={}, components={}, covariance={}, "
+            "converged={}, iter={}, seen={}, logp_mean={:.3f}, logp_std={:.3f}".format(
+                mode,
                 X.shape,
-                self.model.n_components,
+                self.gmm_.n_components,
+                self.gmm_.covariance_type,
                 converged,
                 n_iter,
+                self.n_seen_,
                 self._logp_mean,
                 self._logp_std,
             )
         )
-        return self
+
+    def _select(self, X):
+        """成分数×共分散形式の候補から並列学習でモデルを選ぶ。"""
+        return select_mixture(
+            X,
+            components=self.model.gmm_candidate_components,
+            covariance_types=self.model.gmm_candidate_covariances,
+            n_init=self.model.gmm_n_init,
+            criterion=self.model.gmm_selection,
+            tolerance=self.model.gmm_selection_tolerance,
+            random_state=self.model.random_state,
+            max_workers=self.model.gmm_selection_workers,
+        )
+
+    def export_state(self) -> dict:
+        """学習済みの混合分布を配列と数値だけの辞書で返す(プロセス間の受け渡し用)。"""
+        if self.gmm_ is None:
+            raise RuntimeError("GMM must be fitted before exporting its state.")
+        mixture = self.gmm_
+        return {
+            "covariance_type": mixture.covariance_type,
+            "weights": mixture.weights_,
+            "means": mixture.means_,
+            "covariances": mixture.covariances_,
+            "precisions_cholesky": mixture.precisions_cholesky_,
+            "converged": bool(getattr(mixture, "converged_", True)),
+            "n_iter": int(getattr(mixture, "n_iter_", 0)),
+            "lower_bound": float(getattr(mixture, "lower_bound_", np.nan)),
+            "n_seen": int(self.n_seen_),
+            "logp_mean": self._logp_mean,
+            "logp_std": self._logp_std,
+        }
+
+    def load_state(self, state: dict) -> None:
+        """export_state の結果から GaussianMixture と採点器を組み立て直す。"""
+        means = np.asarray(state["means"])
+        covariance_type = state["covariance_type"]
+        mixture = GaussianMixture(
+            n_components=means.shape[0],
+            covariance_type=covariance_type,
+            random_state=self.model.random_state,
+        )
+        mixture.weights_ = np.asarray(state["weights"])
+        mixture.means_ = means
+        mixture.covariances_ = np.asarray(state["covariances"])
+        mixture.precisions_cholesky_ = np.asarray(state["precisions_cholesky"])
+        mixture.precisions_ = _precisions(
+            mixture.precisions_cholesky_, covariance_type
+        )
+        mixture.converged_ = state["converged"]
+        mixture.n_iter_ = state["n_iter"]
+        mixture.lower_bound_ = state["lower_bound"]
+        mixture.n_features_in_ = means.shape[1]
+        self.gmm_ = mixture
+        self.scorer_ = FastGMMScorer.from_mixture(mixture)
+        self.candidates_ = []
+        self.n_seen_ = int(state.get("n_seen", 0))
+        self._stats = None
+        self._logp_mean = state["logp_mean"]
+        self._logp_std = state["logp_std"]
 
     def transform(self, X):
         return self._anomaly_scores(X)
@@ -54,5 +243,220 @@ class GMM(BaseEstimator, TransformerMixin):
         if X.ndim == 1:
             X = X[np.newaxis, :]
 
-        log_probs = self.gmm_.score_samples(X)
+        log_probs = self.scorer_.score_samples(X)
         return -log_probs
+
+
+class FastGMMScorer:
+    """学習済み GaussianMixture の対数尤度を推論用に高速に求める。
+
+    精度行列のコレスキー因子・log(重み)+log|det| を学習時に1度だけ
+    float32 の連続配列へ詰めておき、score_samples では入力検証を省いて
+    中心化・バッチ行列積・logsumexp だけを行う。中心化は float64 で引いてから
+    float32 へ丸めるので、平均が広がりに比べて大きな特徴量(正規化前の対数メルなど)
+    でも桁落ちしない。diag と spherical は因子が
+    対角なので行列積の代わりに要素ごとの積にする。作業用の配列は入力の行数に
+    合わせて使い回す(同じインスタンスを複数スレッドから同時に呼ばないこと)。
+    結果は sklearn の score_samples と float32 の丸め誤差の範囲で一致する。
+    """
+
+    def __init__(self, means, precisions_cholesky, weights, covariance_type):
+        means = np.asarray(means, dtype=np.float64)
+        n_components, n_features = means.shape
+        chol = _full_cholesky(
+            precisions_cholesky, covariance_type, n_components, n_features
+        )
+        log_det = np.log(np.diagonal(chol, axis1=1, axis2=2)).sum(axis=1)
+
+        self.covariance_type = covariance_type
+        self.n_components = n_components
+        self.n_features = n_features
+        self.means = np.ascontiguousarray(means)
+        self.precisions_cholesky = np.ascontiguousarray(chol, dtype=np.float32)
+        self._diagonal = None
+        if covariance_type in ("diag", "spherical"):
+            self._diagonal = np.ascontiguousarray(
+                np.diagonal(chol, axis1=1, axis2=2)[:, np.newaxis, :],
+                dtype=np.float32,
+            )
+        # 成分ごとの定数項: log(重み) + log|det(精度のコレスキー因子)| - d/2 log(2π)
+        self.log_norm = np.ascontiguousarray(
+            np.log(weights) + log_det - 0.5 * n_features * np.log(2 * np.pi),
+            dtype=np.float32,
+        )
+        self._capacity = 0
+        self._centered = None
+        self._projected = None
+        self._log_prob = None
+        self._log_max = None
+
+    @classmethod
+    def from_mixture(cls, mixture: GaussianMixture) -> "FastGMMScorer":
+        return cls(
+            mixture.means_,
+            mixture.precisions_cholesky_,
+            mixture.weights_,
+            mixture.covariance_type,
+        )
+
+    def score_samples(self, X) -> np.ndarray:
+        """各行の対数尤度を返す(sklearn の score_samples 相当)。"""
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n = X.shape[0]
+        self._reserve(n)
+        centered = self._centered[:, :n]
+        projected = self._projected[:, :n]
+        log_prob = self._log_prob[:n]
+        log_max = self._log_max[:n]
+
+        # (K, n, d) に中心化し、成分ごとのコレスキー因子を1回のバッチ行列積で掛ける。
+        # 差は float64 で求めてから float32 の作業配列へ書き込む
+        np.subtract(
+            X[np.newaxis], self.means[:, np.newaxis], out=centered, casting="same_kind"
+        )
+        if self._diagonal is None:
+            np.matmul(centered, self.precisions_cholesky, out=projected)
+        else:
+            np.multiply(centered, self._diagonal, out=projected)
+        np.square(projected, out=projected)
+        np.sum(projected, axis=2, out=log_prob.T)
+        log_prob *= -0.5
+        log_prob += self.log_norm
+
+        # logsumexp(成分方向)。最大値を引いてから指数を取り、桁あふれを防ぐ
+        np.max(log_prob, axis=1, out=log_max)
+        log_prob -= log_max[:, np.newaxis]
+        np.exp(log_prob, out=log_prob)
+        scores = np.log(log_prob.sum(axis=1, dtype=np.float64))
+        scores += log_max
+        return scores
+
+    def _reserve(self, n: int) -> None:
+        if n <= self._capacity:
+            return
+        capacity = max(n, 2 * self._capacity)
+        k, d = self.n_components, self.n_features
+        self._centered = np.empty((k, capacity, d), dtype=np.float32)
+        self._projected = np.empty((k, capacity, d), dtype=np.float32)
+        self._log_prob = np.empty((capacity, k), dtype=np.float32)
+        self._log_max = np.empty(capacity, dtype=np.float32)
+        self._capacity = capacity
+
+
+def _stats_from_mixture(mixture):
+    """混合分布のパラメーターから、1フレームあたりの十分統計量を逆算する。
+
+    学習済みの共分散には reg_covar が足されているので、Mステップで
+    二重に足さないよう引いてから戻す。
+    """
+    weights = mixture.weights_
+    means = mixture.means_
+    cov = mixture.covariances_
+    if mixture.covariance_type in ("full", "tied"):
+        cov = cov - mixture.reg_covar * np.eye(means.shape[1])
+    else:
+        cov = cov - mixture.reg_covar
+    s1 = weights[:, np.newaxis] * means
+    covariance_type = mixture.covariance_type
+    if covariance_type == "full":
+        outer = means[:, :, np.newaxis] * means[:, np.newaxis, :]
+        s2 = weights[:, np.newaxis, np.newaxis] * (cov + outer)
+    elif covariance_type == "tied":
+        s2 = cov + (s1.T @ means)
+    elif covariance_type == "diag":
+        s2 = weights[:, np.newaxis] * (cov + means**2)
+    else:
+        s2 = weights[:, np.newaxis] * (cov[:, np.newaxis] + means**2)
+    return weights.copy(), s1, s2
+
+
+def _batch_stats(X, resp, covariance_type):
+    """バッチの十分統計量 (Σγ, Σγx, Σγx²) をフレーム数で割って返す。"""
+    n = len(X)
+    s0 = resp.sum(axis=0) / n
+    s1 = resp.T @ X / n
+    if covariance_type == "full":
+        s2 = np.einsum("nk,ni,nj->kij", resp, X, X, optimize=True) / n
+    elif covariance_type == "tied":
+        s2 = X.T @ X / n
+    else:
+        # spherical も対角の2次モーメントを持ち、Mステップで特徴量方向に平均する
+        s2 = resp.T @ (X**2) / n
+    return s0, s1, s2
+
+
+def _maximize(stats, mixture):
+    """十分統計量から重み・平均・共分散を求める(Mステップ)。"""
+    s0, s1, s2 = stats
+    reg = mixture.reg_covar
+    nk = s0 + 10 * np.finfo(s0.dtype).eps
+    weights = nk / nk.sum()
+    means = s1 / nk[:, np.newaxis]
+    covariance_type = mixture.covariance_type
+    n_features = means.shape[1]
+    if covariance_type == "full":
+        outer = means[:, :, np.newaxis] * means[:, np.newaxis, :]
+        cov = s2 / nk[:, np.newaxis, np.newaxis] - outer
+        cov += reg * np.eye(n_features)
+    elif covariance_type == "tied":
+        cov = (s2 - (nk[:, np.newaxis] * means).T @ means) / nk.sum()
+        cov += reg * np.eye(n_features)
+    else:
+        cov = s2 / nk[:, np.newaxis] - means**2 + reg
+        if covariance_type == "spherical":
+            cov = cov.mean(axis=1)
+    return weights, means, cov
+
+
+def _set_parameters(mixture, weights, means, covariances):
+    mixture.weights_ = weights
+    mixture.means_ = means
+    mixture.covariances_ = covariances
+    mixture.precisions_cholesky_ = _precision_cholesky(
+        covariances, mixture.covariance_type
+    )
+    mixture.precisions_ = _precisions(
+        mixture.precisions_cholesky_, mixture.covariance_type
+    )
+
+
+def _precision_cholesky(covariances, covariance_type):
+    """共分散から精度行列のコレスキー因子を求める(sklearn と同じ形)。"""
+    if covariance_type in ("diag", "spherical"):
+        return 1.0 / np.sqrt(covariances)
+    eye = np.eye(covariances.shape[-1])
+    if covariance_type == "tied":
+        cov_chol = linalg.cholesky(covariances, lower=True)
+        return linalg.solve_triangular(cov_chol, eye, lower=True).T
+    chol = np.empty_like(covariances)
+    for k, cov in enumerate(covariances):
+        cov_chol = linalg.cholesky(cov, lower=True)
+        chol[k] = linalg.solve_triangular(cov_chol, eye, lower=True).T
+    return chol
+
+
+def _precisions(precisions_cholesky, covariance_type):
+    """精度行列のコレスキー因子から精度行列を求める(sklearn と同じ形)。"""
+    chol = np.asarray(precisions_cholesky)
+    if covariance_type == "full":
+        return np.matmul(chol, chol.transpose(0, 2, 1))
+    if covariance_type == "tied":
+        return chol @ chol.T
+    return chol**2
+
+
+def _full_cholesky(precisions_cholesky, covariance_type, n_components, n_features):
+    """どの共分散形式の精度コレスキー因子も (K, d, d) の上三角行列にそろえる。"""
+    chol = np.asarray(precisions_cholesky, dtype=np.float64)
+    if covariance_type == "full":
+        return chol
+    if covariance_type == "tied":
+        return np.broadcast_to(chol, (n_components, n_features, n_features)).copy()
+    eye = np.eye(n_features)
+    if covariance_type == "diag":
+        return chol[:, np.newaxis, :] * eye
+    if covariance_type == "spherical":
+        return chol[:, np.newaxis, np.newaxis] * eye
+    raise ValueError(f"unknown covariance_type: {covariance_type}")
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Optional, Sequence
+
+import numpy as np
+from sklearn.mixture import GaussianMixture
+
+CRITERIA = ("bic", "aic", "heldout")
+
+# ワーカープロセスごとに1度だけ受け取る学習データ
+_worker_data: Optional[np.ndarray] = None
+
+
+@dataclass
+class Candidate:
+    """モデル選択で評価した1候補(成分数×共分散形式)の結果。"""
+
+    n_components: int
+    covariance_type: str
+    score: float
+    cost: int
+    mixture: GaussianMixture = field(repr=False)
+
+
+def scoring_cost(n_components: int, covariance_type: str, n_features: int) -> int:
+    """1フレームの採点にかかる積和の回数の目安(FastGMMScorer の計算量)。"""
+    if covariance_type in ("full", "tied"):
+        return n_components * n_features * n_features
+    return n_components * n_features
+
+
+def select_mixture(
+    X: np.ndarray,
+    components: Sequence[int],
+    covariance_types: Sequence[str],
+    n_init: int = 1,
+    criterion: str = "bic",
+    tolerance: float = 0.01,
+    heldout_fraction: float = 0.2,
+    random_state: int = 0,
+    max_workers: Optional[int] = None,
+) -> tuple[GaussianMixture, list[Candidate]]:
+    """成分数と共分散形式の組み合わせを並列に学習し、1つを選んで返す。
+
+    各組み合わせを n_init 通りの乱数で別々のタスクとしてプロセスプールで学習し、
+    下界の最も高い初期化を残す。criterion が "bic"/"aic" なら全データで学習して
+    情報量規準で、"heldout" なら heldout_fraction を除いて学習し、除いたデータの
+    平均対数尤度で比べる。最良との差が tolerance (相対) 以内の候補からは
+    採点コストが最も小さいものを選ぶ。max_workers=1 ならプロセスを使わない。
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"unknown selection criterion: {criterion}")
+    X = np.asarray(X, dtype=np.float64)
+    train, valid = X, None
+    if criterion == "heldout":
+        order = np.random.default_rng(random_state).permutation(len(X))
+        n_valid = max(1, int(len(X) * heldout_fraction))
+        train, valid = X[order[n_valid:]], X[order[:n_valid]]
+
+    # 学習データより多い成分数は選べない
+    grid = [
+        (k, cov, random_state + i)
+        for (k, cov), i in product(
+            product(components, covariance_types), range(max(1, n_init))
+        )
+        if k <= len(train)
+    ]
+    if not grid:
+        raise ValueError("No GMM candidate fits the number of training frames.")
+
+    fitted = _fit_grid(train, grid, max_workers)
+    best_inits: dict = {}
+    for (k, cov, _), mixture in zip(grid, fitted):
+        current = best_inits.get((k, cov))
+        if current is None or mixture.lower_bound_ > current.lower_bound_:
+            best_inits[(k, cov)] = mixture
+
+    candidates = []
+    for (k, cov), mixture in best_inits.items():
+        if criterion == "bic":
+            score = mixture.bic(X)
+        elif criterion == "aic":
+            score = mixture.aic(X)
+        else:
+            # 大きいほど良いので、他の規準とそろえて小さいほど良い値にする
+            score = -mixture.score(valid)
+        cost = scoring_cost(k, cov, X.shape[1])
+        candidates.append(Candidate(k, cov, float(score), cost, mixture))
+
+    best = min(c.score for c in candidates)
+    margin = tolerance * max(abs(best), 1e-12)
+    acceptable = [c for c in candidates if c.score <= best + margin]
+    chosen = min(acceptable, key=lambda c: (c.cost, c.score))
+
+    mixture = chosen.mixture
+    if criterion == "heldout":
+        # 選んだ形で全データを使って学習し直す
+        mixture = _fit_one(
+            X, chosen.n_components, chosen.covariance_type, random_state, n_init
+        )
+    candidates.sort(key=lambda c: c.score)
+    return mixture, candidates
+
+
+def _fit_grid(train, grid, max_workers):
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) - 1)
+    max_workers = min(max_workers, len(grid))
+    if max_workers <= 1:
+        return [_fit_one(train, k, cov, seed) for k, cov, seed in grid]
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(train,)
+    ) as pool:
+        return list(pool.map(_fit_task, grid))
+
+
+def _init_worker(data: np.ndarray) -> None:
+    global _worker_data
+    _worker_data = data
+
+
+def _fit_task(task) -> GaussianMixture:
+    k, cov, seed = task
+    return _fit_one(_worker_data, k, cov, seed)
+
+
+def _fit_one(X, n_components, covariance_type, seed, n_init=1) -> GaussianMixture:
+    mixture = GaussianMixture(
+        n_components=n_components,
+        covariance_type=covariance_type,
+        n_init=n_init,
+        random_state=seed,
+    )
+    return mixture.fit(X)
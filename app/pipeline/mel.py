@@ -2,11 +2,37 @@ import librosa.filters as filter
 from scipy.sparse import csr_matrix
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from app.pipeline.cache import artifacts
+
 
 class Mel(BaseEstimator, TransformerMixin):
     def __init__(self, model):
         self.model = model
-        self.melfb = csr_matrix(
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return self._mel(X)
+
+    def _mel(self, x):
+        return self.melfb.dot(x.T).T
+
+    @property
+    def melfb(self):
+        key = (
+            "mel",
+            self.fs,
+            self.n_fft,
+            self.n_mels,
+            self.f_min,
+            self.f_max,
+            self.f_range,
+        )
+        return artifacts.get(key, self._design_filterbank)
+
+    def _design_filterbank(self):
+        return csr_matrix(
             filter.mel(
                 sr=self.fs,
                 n_fft=self.n_fft,
@@ -18,15 +44,6 @@ class Mel(BaseEstimator, TransformerMixin):
             )[:, : self.f_range]
         )
 
-    def fit(self, X, y=None):
-        return self
-
-    def transform(self, X):
-        return self._mel(X)
-
-    def _mel(self, x):
-        return self.melfb.dot(x.T).T
-
     @property
     def fs(self):
         return self.model.sample_rate
@@ -49,4 +66,4 @@ class Mel(BaseEstimator, TransformerMixin):
 
     @property
     def f_range(self):
-        return int(self.n_fft / 2.56) + 1
+        return self.model.fft_bins
@@ -1,19 +1,52 @@
+import numpy as np
 from sklearn.pipeline import Pipeline
 
 from app.pipeline.bandpass import BandPassFilter
+from app.pipeline.decimate import Decimate, analysis_model
 from app.pipeline.fft import FastFourierTransform
+from app.pipeline.fused import FusedMelSpectrum
 from app.pipeline.gmm import GMM
 from app.pipeline.mel import Mel
-from app.pipeline.stft import ShortTimeFourierTransform
+from app.pipeline.stft import (
+    ShortTimeFourierTransform,
+    StreamingShortTimeFourierTransform,
+)
 from app.pipeline.zscore import ZScore
 
 
+def front_end(model, streaming=False) -> list:
+    """間引きと時間領域フィルターの段を返す。
+
+    間引きが無効なら間引き段を、FFT段で帯域制限する場合はフィルター段を省く。
+    """
+    steps = []
+    if model.decimate_sample_rate:
+        steps.append(("decimate", Decimate(model, streaming=streaming)))
+    if not model.spectral_band_limit:
+        analysis = analysis_model(model)
+        steps.append(
+            ("bandpass_filter", BandPassFilter(analysis, streaming=streaming))
+        )
+    return steps
+
+
 def melspec_zscore(model) -> Pipeline:
+    analysis = analysis_model(model)
+    if model.fft_fused:
+        pipeline = Pipeline(
+            front_end(model)
+            + [
+                ("melspec", FusedMelSpectrum(analysis)),
+                ("anomaly", ZScore()),
+            ]
+        )
+        return pipeline
+
     pipeline = Pipeline(
-        [
-            ("bandpass_filter", BandPassFilter(model)),
-            ("fft", FastFourierTransform(model)),
-            ("mel", Mel(model)),
+        front_end(model)
+        + [
+            ("fft", FastFourierTransform(analysis)),
+            ("mel", Mel(analysis)),
             ("anomaly", ZScore()),
         ]
     )
@@ -21,12 +54,58 @@ def melspec_zscore(model) -> Pipeline:
 
 
 def gmm(model) -> Pipeline:
+    analysis = analysis_model(model)
     pipeline = Pipeline(
-        [
-            ("bandpass_filter", BandPassFilter(model)),
-            ("stft", ShortTimeFourierTransform(model)),
-            ("mel", Mel(model)),
+        front_end(model)
+        + [
+            ("stft", ShortTimeFourierTransform(analysis)),
+            ("mel", Mel(analysis)),
             ("gmm", GMM(model)),
         ]
     )
     return pipeline
+
+
+def rub_features(model) -> Pipeline:
+    """擦りの特徴量(メルスペクトル)をブロックごとに求めるストリーミング前段。"""
+    analysis = analysis_model(model)
+    pipeline = Pipeline(
+        front_end(model, streaming=True)
+        + [
+            ("stft", StreamingShortTimeFourierTransform(analysis)),
+            ("mel", Mel(analysis)),
+        ]
+    )
+    return pipeline
+
+
+def gmm_stream(model, fitted: Pipeline) -> Pipeline:
+    """学習済みgmmパイプラインの前段とSTFTを状態を持つストリーミング版へ差し替える。"""
+    steps = dict(fitted.named_steps)
+    pipeline = Pipeline(
+        front_end(model, streaming=True)
+        + [
+            ("stft", StreamingShortTimeFourierTransform(analysis_model(model))),
+            ("mel", steps["mel"]),
+            ("gmm", steps["gmm"]),
+        ]
+    )
+    return pipeline
+
+
+def stream_frame_counts(model, sample_ends) -> np.ndarray:
+    """rub_features に累積 sample_ends[i] サンプルまで入れた時点で、
+    各ブロックが新たに完成させるフレーム数を返す。
+
+    ストリーミング段はブロックの区切りに関係なく同じ出力を返すので、
+    信号全体を1回で通したときのフレームをブロックへ割り当て直すのに使う。
+    """
+    ends = np.asarray(sample_ends, dtype=np.int64)
+    if model.decimate_sample_rate:
+        up, down = Decimate(model).ratio
+        ends = np.where(ends > 0, (ends - 1) * up // down + 1, 0)
+    analysis = analysis_model(model)
+    n_fft = analysis.fft_size
+    step = n_fft - analysis.stft_overlap
+    total = np.where(ends >= n_fft, (ends - n_fft) // step + 1, 0)
+    return np.diff(total, prepend=0)
@@ -1,7 +1,11 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy import signal
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from app.pipeline.bandpass import spectral_mask
+from app.pipeline.cache import artifacts
+
 
 class ShortTimeFourierTransform(BaseEstimator, TransformerMixin):
     def __init__(self, model):
@@ -15,49 +19,136 @@ class ShortTimeFourierTransform(BaseEstimator, TransformerMixin):
 
     def _stft_one(self, x):
         """短いフレームではゼロ詰めFFTへ切り替えながらSTFTを適用する。"""
-        x = np.asarray(x).astype(np.float32)
-        n_fft = self.model.fft_size
-        fs = self.model.sample_rate
-
-        if x.size < n_fft:
-            pad = n_fft - x.size
-            x_pad = np.pad(x, (0, pad)) if pad > 0 else x
-            win = signal.get_window(self.model.fft_window, n_fft, fftbins=True)
-            frame = x_pad[:n_fft] * win
-            Z = np.fft.rfft(frame)
-            Z = Z[: self.f_range]
-            S = np.abs(Z)[np.newaxis, :]
-        else:
-            f, t, Zxx = signal.stft(
-                x,
-                fs=fs,
-                window=self.model.fft_window,
-                nperseg=n_fft,
-                noverlap=self.model.stft_overlap,
-                nfft=n_fft,
-                return_onesided=True,
-            )
-            Zxx = Zxx[: self.f_range, :]
-            S = np.abs(Zxx).T
-        if self.model.fft_power not in (None, 1.0):
-            S = S**self.model.fft_power
-
-        return S
+        return self._stft_batch([x])[0]
 
     def _stft_any(self, X):
         if isinstance(X, (list, tuple)):
-            return [self._stft_one(np.asarray(x)) for x in X]
+            return self._stft_batch(X)
 
         X = np.asarray(X)
 
         if X.ndim == 1:
             return self._stft_one(X)
         if X.ndim == 2:
-            outs = [self._stft_one(row) for row in X]
-            return np.concatenate(outs, axis=0)
+            return self._stft_rows(X)
 
         raise ValueError(f"X must be 1D or 2D, got shape {X.shape}")
 
+    # ------------------------------------------------------------------ #
+    # バッチ処理
+    # ------------------------------------------------------------------ #
+    def _stft_rows(self, X):
+        """同じ長さの行をまとめてフレーム化し、1回のrfftで処理する。"""
+        X = X.astype(np.float32, copy=False)
+        n_rows = X.shape[0]
+        if n_rows == 0:
+            return np.empty((0, self.f_range), dtype=np.float32)
+        frames, scale = self._frames_2d(X)
+        frames = frames.reshape(n_rows * frames.shape[1], self.n_fft)
+        return self._spectrum(frames, scale)
+
+    def _stft_batch(self, signals):
+        """長さの異なる信号をフレーム化し、全フレームを1回のrfftで処理する。"""
+        if len(signals) == 0:
+            return []
+
+        frames_list = []
+        scales = []
+        counts = []
+        for x in signals:
+            x = np.asarray(x, dtype=np.float32).ravel()
+            frames, scale = self._frames_2d(x[np.newaxis, :])
+            frames = frames[0]
+            frames_list.append(frames)
+            scales.append(np.full(frames.shape[0], scale, dtype=np.float32))
+            counts.append(frames.shape[0])
+
+        frames = np.concatenate(frames_list, axis=0)
+        scale = np.concatenate(scales)[:, np.newaxis]
+        S = self._spectrum(frames, scale)
+        return np.split(S, np.cumsum(counts)[:-1], axis=0)
+
+    def _frames_2d(self, X):
+        """(N, L)の信号を(N, T, n_fft)の窓掛け済みフレームへ変換する。
+
+        n_fft以上の信号は scipy.signal.stft と同じ境界ゼロ詰め・末尾パディングを行い、
+        窓の総和で正規化する。短い信号はゼロ詰めした1フレームとして扱う。
+        """
+        n_fft = self.n_fft
+        n_samples = X.shape[-1]
+        win = _get_window(self.model.fft_window, n_fft)
+
+        if n_samples < n_fft:
+            x_pad = np.zeros((X.shape[0], n_fft), dtype=np.float32)
+            x_pad[:, :n_samples] = X
+            return (x_pad * win)[:, np.newaxis, :], 1.0
+
+        step = n_fft - self.model.stft_overlap
+        half = n_fft // 2
+        padded_len = n_samples + 2 * half
+        tail = (-(padded_len - n_fft) % step) % n_fft
+        x_pad = np.zeros((X.shape[0], padded_len + tail), dtype=np.float32)
+        x_pad[:, half : half + n_samples] = X
+        frames = sliding_window_view(x_pad, n_fft, axis=-1)[:, ::step, :]
+        return frames * win, 1.0 / win.sum()
+
+    def _spectrum(self, frames, scale):
+        Z = np.fft.rfft(frames, n=self.n_fft, axis=-1)[:, : self.f_range]
+        S = np.abs(Z)
+        S *= scale
+        mask = spectral_mask(self.model, self.n_fft, self.f_range)
+        if mask is not None:
+            S *= mask
+        if self.model.fft_power not in (None, 1.0):
+            S = S**self.model.fft_power
+        return S
+
+    @property
+    def n_fft(self):
+        return self.model.fft_size
+
     @property
     def f_range(self):
-        return int(self.model.fft_size / 2.56) + 1
+        return self.model.fft_bins
+
+
+class StreamingShortTimeFourierTransform(ShortTimeFourierTransform):
+    """ブロック間でオーバーラップ分を保持し、完成したフレームだけを返すSTFT。
+
+    学習時と同じ窓・ホップ・正規化でフレームを切り出すため、ゼロ詰めの
+    半端なフレームは出力しない。1回の transform で返るフレーム数は
+    新しく届いたサンプル数で決まり、足りなければ0行になる。
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._tail = np.empty(0, dtype=np.float32)
+
+    def reset(self):
+        self._tail = np.empty(0, dtype=np.float32)
+
+    def transform(self, X):
+        return self._stft_stream(X)
+
+    def _stft_stream(self, x):
+        x = np.asarray(x, dtype=np.float32).ravel()
+        buf = np.concatenate((self._tail, x)) if self._tail.size else x
+        n_fft = self.n_fft
+        step = n_fft - self.model.stft_overlap
+
+        if buf.size < n_fft:
+            self._tail = buf.copy()
+            return np.empty((0, self.f_range), dtype=np.float32)
+
+        n_frames = (buf.size - n_fft) // step + 1
+        win = _get_window(self.model.fft_window, n_fft)
+        frames = sliding_window_view(buf, n_fft)[::step][:n_frames]
+        self._tail = buf[n_frames * step :].copy()
+        return self._spectrum(frames * win, 1.0 / win.sum())
+
+
+def _get_window(name, n_fft):
+    return artifacts.get(
+        ("window", name, n_fft, "float32"),
+        lambda: signal.get_window(name, n_fft, fftbins=True).astype(np.float32),
+    )
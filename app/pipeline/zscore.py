@@ -21,6 +21,14 @@ class ZScore(BaseEstimator, TransformerMixin):
     def fit_transform(self, X, y=None):
         return self.fit(X).transform(X)
 
+    def export_state(self) -> dict:
+        """学習結果(平均と標準偏差)を配列だけの辞書で返す。"""
+        return {"mean": self.mean, "std": self.std}
+
+    def load_state(self, state: dict) -> None:
+        self.mean = np.asarray(state["mean"])
+        self.std = np.asarray(state["std"])
+
     @property
     def mean(self):
         return self._mean
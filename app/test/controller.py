@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 from datetime import datetime
 from pathlib import Path
@@ -5,7 +7,6 @@ from time import monotonic
 
 import sounddevice as sd
 from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import QFileDialog
 
 from app.base.controller import ControllerBase
@@ -29,6 +30,8 @@ class TestController(ControllerBase):
         self._beep_is_playing: bool = False
         self.anomaly_cooldown_sec: float = 1.0
         self._anomaly_suppressed_until: float = 0.0
+        self._rub_sample_cursor: int = 0
+        self._camera_timestamp = None
 
         self.add_timeout_method(self.model.trigger.trigger)
         self.model.timer.signal.connect(self.handle_camera)
@@ -118,9 +121,14 @@ class TestController(ControllerBase):
 
     def handle_camera(self):
         if self.model.camera_is_stream and self.model.current_window == Window.TEST:
-            _data = self.model.camera_data
-            if self.monitor_view_enabled:
-                self.view.image(self.view.camera_image, _data)
+            if not self.monitor_view_enabled:
+                return
+            frame, timestamp = self.model.camera_frame
+            # 未取得のときと前回と同じフレームのときは描画し直さない
+            if frame is None or timestamp == self._camera_timestamp:
+                return
+            self._camera_timestamp = timestamp
+            self.view.image(self.view.camera_image, frame)
 
     def handle_test_data(self):
         if not self.is_tapping_mode:
@@ -141,7 +149,9 @@ class TestController(ControllerBase):
             medium = self.model.anomaly_threshold[-1]
             flg_test = True
             if anomaly > medium and flg_test:
-                self._capture_anomaly_event(anomaly)
+                # 推論後に撮るとハンマーが画角から外れるので、叩いた瞬間のフレームを使う
+                hit_time = self.model.sample_time(self.model.trigger_index)
+                self._capture_anomaly_event(anomaly, hit_time)
 
     def _set_tapping(self):
         if self.is_tapping_mode:
@@ -207,6 +217,8 @@ class TestController(ControllerBase):
         self.model.gmm_is_infering = enabled
         if not enabled:
             return
+        self.model.reset_rub_stream()
+        self._rub_sample_cursor = self.model.sample_count
 
     def handle_rub_inference(self):
         if not (
@@ -219,30 +231,35 @@ class TestController(ControllerBase):
             or not self.model.rub_trained
         ):
             return
-        if self._is_anomaly_suppressed():
-            return
-        block = getattr(self.model, "block_data", None)
-        if block is None or getattr(block, "size", 0) == 0:
+        samples, self._rub_sample_cursor = self.model.samples_since(
+            self._rub_sample_cursor
+        )
+        if samples.size == 0:
             return
         try:
-            raw_anomaly = self.model.compute_rub_anomaly(block)
+            # 抑制中もフレーミングの状態を保つため、ストリームには流し続ける
+            raw_anomaly = self.model.compute_rub_stream_anomaly(samples)
         except Exception as exc:
             self.view.error(str(exc))
             return
+        if raw_anomaly is None or self._is_anomaly_suppressed():
+            return
         standardized = self.model.standardize_pretrain(raw_anomaly)
         normalized = self.model.standardize_training(standardized)
         absolute = self.model.denormalize_training(normalized)
         zero_point = self.model.train_score_mean
         anomaly = max(absolute - zero_point, 0.0)
         self.model.record_rub_anomaly_score(anomaly)
-        indices, scores, colors = self.model.latest_rub_anomaly_series(
+        indices, scores, levels = self.model.latest_rub_anomaly_series(
             self.model.display_count
         )
-        self.view.plot_rub_anomaly_scatter(indices, scores, colors)
+        self.view.plot_rub_anomaly_scatter(indices, scores, levels)
         low, medium, high = self.model.rub_threshold_offsets()
         self.view.threshold(low, medium, high)
         if anomaly > high:
-            self._capture_anomaly_event(anomaly)
+            self._capture_anomaly_event(
+                anomaly, self.model.sample_time(self._rub_sample_cursor)
+            )
 
     def get_folder_path(self):
         """撮影ファイル用フォルダーを選択または作成できるようにする。"""
@@ -271,40 +288,28 @@ class TestController(ControllerBase):
     def make_dir(self, folder_path: Path):
         folder_path.mkdir(parents=True, exist_ok=True)
 
-    def save_jpg(self, anomaly: float) -> None:
-        frame = getattr(self.model, "camera_data", None)
+    def save_jpg(self, anomaly: float, timestamp: float | None = None) -> None:
+        """スナップショットの保存をライターへ依頼する(エンコードと書き込みは別スレッド)。"""
+        writer = self.model.snapshot_writer
+        error = writer.take_error()
+        if error is not None:
+            self.view.error(error)
+
+        frame, _ = self.model.camera_frame_at(timestamp)
         if frame is None:
             return
+        # 保存が追いつかない間は捨てる(件数は writer.dropped に残る)
+        writer.submit(frame, self.selected_path, anomaly)
 
-        image = frame.transpose((1, 0, 2)).copy()
-        height, width, _ = image.shape
-        bytes_per_line = 3 * width
-
-        q_image = QImage(
-            image.data,
-            width,
-            height,
-            bytes_per_line,
-            QImage.Format.Format_RGB888,
-        )
-
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{timestamp}_{anomaly:.2f}.jpg"
-        base_path = Path(self.selected_path)
-        base_path.mkdir(parents=True, exist_ok=True)
-        target_path = base_path / filename
-        unique_path = Path(get_unique_filepath(str(target_path)))
-
-        if not q_image.save(str(unique_path), "JPG", 90):
-            self.view.error(f"Failed to save snapshot to {unique_path}.")
-
-    def _capture_anomaly_event(self, anomaly: float) -> None:
+    def _capture_anomaly_event(
+        self, anomaly: float, timestamp: float | None = None
+    ) -> None:
         if self._beep_is_playing:
             return
         self._beep_is_playing = True
         self._start_anomaly_cooldown()
         try:
-            self.save_jpg(anomaly)
+            self.save_jpg(anomaly, timestamp)
         except Exception as exc:
             self.view.error(str(exc))
             self._finish_beep()
@@ -333,22 +338,3 @@ class TestController(ControllerBase):
 
     def _is_anomaly_suppressed(self) -> bool:
         return monotonic() < self._anomaly_suppressed_until
-
-
-
-def get_unique_filepath(filepath_str: str) -> str:
-    """既存ファイルがあれば番号を付けて一意なパスを返す。"""
-    path = Path(filepath_str)
-    if not path.exists():
-        return str(path)
-
-    parent = path.parent
-    stem = path.stem
-    suffix = path.suffix
-
-    i = 1
-    while True:
-        candidate = parent / f"{stem}_{i}{suffix}"
-        if not candidate.exists():
-            return str(candidate)
-        i += 1
@@ -5,6 +5,11 @@ import pyqtgraph as pg
 import qdarkstyle as qds
 
 from app.base.view import ViewBase
+from app.util.levels import classify
+
+# 段階(0: 正常 / 1: 注意 / 2: 異常)ごとの散布図の色
+TAP_LEVEL_COLORS = ("b", "y", "r")
+RUB_LEVEL_COLORS = ("#2196F3", "#FFEB3B", "#F44336")
 
 
 class TestView(ViewBase):
@@ -14,6 +19,15 @@ class TestView(ViewBase):
         self._init_graphics_view_monitor()
         self._set_graphicsView_Data()
         self.anomaly_plot_item = None
+        # ブラシは毎回作らず、段階番号で引けるように一度だけ作る
+        self._tap_brushes = self._make_palette(TAP_LEVEL_COLORS)
+        self._rub_brushes = self._make_palette(RUB_LEVEL_COLORS)
+
+    @staticmethod
+    def _make_palette(colors) -> np.ndarray:
+        palette = np.empty(len(colors), dtype=object)
+        palette[:] = [pg.mkBrush(c) for c in colors]
+        return palette
 
     def _init_graphics_view_monitor(self) -> None:
         self.camera_viewbox = self.graphicsView_Monitor.addViewBox(
@@ -71,19 +85,11 @@ class TestView(ViewBase):
             self.scatter.clear()
             return
 
-        last = data[-n_points:]
-        start_idx = len(data) - len(last)
-        xs = np.arange(start_idx, start_idx + len(last), dtype=float)
-
-        t1, t2 = threshold
-        brushes = []
-        for y in last:
-            if y < t1:
-                brushes.append(pg.mkBrush("b"))
-            elif y < t2:
-                brushes.append(pg.mkBrush("y"))
-            else:
-                brushes.append(pg.mkBrush("r"))
+        last = np.asarray(data[-n_points:], dtype=float)
+        start_idx = len(data) - last.size
+        xs = np.arange(start_idx, start_idx + last.size, dtype=float)
+
+        brushes = self._tap_brushes[classify(last, threshold)]
         self.scatter.setData(x=xs, y=last, brush=brushes)
 
         if len(xs) == 1:
@@ -93,17 +99,17 @@ class TestView(ViewBase):
         self._update_anomaly_y_range(last)
         self._sync_bar_range()
 
-    def plot_rub_anomaly_scatter(self, indices, scores, colors):
-        if not indices or not scores:
+    def plot_rub_anomaly_scatter(self, indices, scores, levels):
+        if len(indices) == 0 or len(scores) == 0:
             self.scatter.clear()
             return
-        brushes = [pg.mkBrush(c) for c in colors] if colors else pg.mkBrush("w")
+        brushes = self._rub_brushes[np.asarray(levels)]
         self.scatter.setData(x=indices, y=scores, brush=brushes)
         if len(indices) == 1:
             self.anomaly_plot.setXRange(indices[0] - 1, indices[0] + 1, padding=0)
         else:
             self.anomaly_plot.setXRange(
-                min(indices) - 0.5, max(indices) + 0.5, padding=0
+                indices[0] - 0.5, indices[-1] + 0.5, padding=0
             )
         self._update_anomaly_y_range(scores)
         self._sync_bar_range()
@@ -10,24 +10,43 @@ from app.base.controller import ControllerBase
 from app.base.model import ModelBase
 from app.base.view import ViewBase
 from app.model.rub import RubPhase
+from app.pipeline.fit_service import FitCancelled
+from app.util.envelope import MinMaxEnvelope
 from app.util.window import Window
 
 
-class GMMFitWorker(QThread):
-    succeeded = pyqtSignal()
+class FitWorker(QThread):
+    """学習プロセス(FitJob)を起動して終了を待ち、進捗と結果をシグナルで伝える。
+
+    学習そのものは別プロセスで行うので、このスレッドはキューを待つだけで
+    GILをほとんど握らない。cancel は待機ループを通じてプロセスへ伝える。
+    """
+
+    progress = pyqtSignal(int, int, str)
+    succeeded = pyqtSignal(object)
     failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, pipeline, data):
+    def __init__(self, job):
         super().__init__()
-        self._pipeline = pipeline
-        self._data = data
+        self._job = job
 
     def run(self):
         try:
-            self._pipeline.fit(self._data)
-            self.succeeded.emit()
+            self._job.start()
+            state = self._job.wait(
+                on_progress=self.progress.emit,
+                should_cancel=self.isInterruptionRequested,
+            )
+        except FitCancelled:
+            self.cancelled.emit()
         except Exception as exc:
             self.failed.emit(str(exc))
+        else:
+            self.succeeded.emit(state)
+
+    def cancel(self):
+        self.requestInterruption()
 
 
 class TrainController(ControllerBase):
@@ -56,20 +75,27 @@ class TrainController(ControllerBase):
         self.model.timer.signal.connect(self.model.trigger.trigger)
         self.model.timer.signal.connect(self.handle_camera)
         self.model.rub_progress.connect(self._on_rub_progress)
-        self._gmm_fit_worker = None
+        self._fit_worker = None
+        self._camera_timestamp = None
+        self._envelope = None
+        self._audio_cursor: int = 0
 
     def on_enter(self, payload=None):
         self.view.set_threshold(self.model.trigger_threshold)
         self.view.verticalSlider_TrigLevel.setValue(self.model.trig_level_val)
+        # サンプルを集めている間に学習プロセスを起動しておく
+        self.model.fit_service.start()
         self.start_process()
 
     def on_pushButton_StartTest_clicked(self):
+        self._cancel_fit()
         self._save_condition()
         self.end_process()
         self.model.current_window = Window.TEST
         self.signal.emit(Window.TEST)
 
     def on_pushButton_ReturnMenu_clicked(self):
+        self._cancel_fit()
         if self.model.thresholded:
             self._save_condition()
         self.end_process()
@@ -91,6 +117,9 @@ class TrainController(ControllerBase):
         self.view.set_threshold(self.model.trigger_threshold)
 
     def on_pushButton_TapTrainSampleStart_clicked(self):
+        if self._fit_worker is not None:
+            self.view.error("Fitting is running. Please wait.")
+            return
         if self.model.trained:
             if self.view.confirm("Delete existing training samples?"):
                 self._delete_train_data()
@@ -111,6 +140,9 @@ class TrainController(ControllerBase):
         self.remove_trigger_method(self.handle_train_data)
 
     def on_pushButton_TapTHSampleStart_clicked(self):
+        if self._fit_worker is not None:
+            self.view.error("Fitting is running. Please wait.")
+            return
         if self.model.thresholded:
             if self.view.confirm("Delete existing threshold samples?"):
                 self._delete_threshold_data()
@@ -129,8 +161,8 @@ class TrainController(ControllerBase):
         self.remove_trigger_method(self.handle_threshold_data)
 
     def on_pushButton_RubTrainSampleStart_clicked(self):
-        if self._gmm_fit_worker is not None:
-            self.view.error("GMM fitting is running. Please wait.")
+        if self._fit_worker is not None:
+            self.view.error("Fitting is running. Please wait.")
             return
         if self.model.rub_session.is_active():
             self.view.error("Audio capture is already active.")
@@ -146,8 +178,8 @@ class TrainController(ControllerBase):
         self.view.set_rub_status("-pretrain-")
 
     def on_pushButton_RubTHSampleStart_clicked(self):
-        if self._gmm_fit_worker is not None:
-            self.view.error("GMM fitting is running. Please wait.")
+        if self._fit_worker is not None:
+            self.view.error("Fitting is running. Please wait.")
             return
         if self.model.rub_session.is_active():
             self.view.error("Audio capture is already active.")
@@ -202,6 +234,15 @@ class TrainController(ControllerBase):
         phase = self.model.rub_phase()
         self.model.stop_rub_collection()
         frames = self.model.rub_frames()
+        try:
+            features = self.model.finish_rub_features()
+        except Exception:
+            # 収集中の抽出に失敗したら、取得済みブロックから一括で求め直す
+            try:
+                features = self.model.compute_rub_features(frames)
+            except Exception as exc:
+                self.view.error(str(exc))
+                return
         if phase is None or not frames:
             self.view.error("Failed to capture audio data.")
             return
@@ -210,32 +251,32 @@ class TrainController(ControllerBase):
         if phase == RubPhase.PRETRAIN:
             self.model.set_rub_train_elapsed(elapsed)
             self.view.set_lcd(self.view.lcdNumber_RubTrainSampleTime, int(elapsed))
-            self._finish_rub_pretraining(frames)
+            self._finish_rub_pretraining(frames, features)
         elif phase == RubPhase.TRAIN:
             self.model.set_rub_threshold_elapsed(elapsed)
             self.view.set_lcd(self.view.lcdNumber_RubTHSampleTimes, int(elapsed))
-            self._finish_rub_training(frames)
+            self._finish_rub_training(frames, features)
         self._set_rub()
 
-    def _finish_rub_pretraining(self, frames):
-        buffer = self.model.rub_buffer
-        if buffer.size == 0:
-            self.view.error("Pre-training buffer is empty.")
-            return
+    def _finish_rub_pretraining(self, frames, features):
         if not self._validate_rub_capture(
             frames, self.model.rub_train_duration_sec, "Rub Pre-training"
         ):
             return
-        worker = GMMFitWorker(self.model.gmm_pipeline, buffer.copy())
-        worker.succeeded.connect(lambda: self._on_pretrain_fit_done(frames))
-        worker.failed.connect(self._handle_fit_failed)
-        worker.finished.connect(self._clear_gmm_worker)
-        self._gmm_fit_worker = worker
-        self.view.show_popup("GMM pre-training is running...")
-        worker.start()
+        matrix, _ = features
+        if len(matrix) == 0:
+            self.view.error("Pre-training buffer is empty.")
+            return
+        # 特徴量は収集中に求め終えているので、学習プロセスはEMだけを行う
+        self._start_fit(
+            "rub",
+            matrix,
+            "GMM pre-training is running...",
+            lambda: self._on_pretrain_fit_done(features),
+        )
 
-    def _on_pretrain_fit_done(self, frames):
-        scores = self._compute_rub_scores(frames)
+    def _on_pretrain_fit_done(self, features):
+        scores = self._compute_rub_scores(features)
         if not scores:
             self.view.error("Failed to compute anomaly scores for pre-training.")
             return
@@ -245,7 +286,7 @@ class TrainController(ControllerBase):
         self._update_rub_train_buttons()
         self._update_rub_finish_label()
 
-    def _finish_rub_training(self, frames):
+    def _finish_rub_training(self, frames, features):
         if not self.model.rub_pretrained:
             self.view.error("Pre-training has not finished yet.")
             return
@@ -253,7 +294,7 @@ class TrainController(ControllerBase):
             frames, self.model.rub_threshold_duration_sec, "Rub Training"
         ):
             return
-        scores = self._compute_rub_scores(frames)
+        scores = self._compute_rub_scores(features)
         if not scores:
             self.view.error("Failed to compute anomaly scores for training.")
             return
@@ -270,28 +311,72 @@ class TrainController(ControllerBase):
         self.model.gmm_trained = True
         self._update_rub_finish_label()
 
-    def _handle_fit_failed(self, message: str):
+    def _start_fit(self, kind: str, data, message: str, on_done):
+        """kind の学習を別プロセスで始め、終わったら結果を読み込んで on_done を呼ぶ。"""
+        worker = FitWorker(self.model.fit_job(kind, data))
+        worker.progress.connect(
+            lambda index, total, name: self._on_fit_progress(
+                worker, message, index, total, name
+            )
+        )
+        worker.succeeded.connect(lambda state: self._on_fit_done(kind, state, on_done))
+        worker.failed.connect(lambda error: self._handle_fit_failed(kind, error))
+        worker.cancelled.connect(lambda: self._handle_fit_cancelled(kind))
+        worker.finished.connect(self._clear_fit_worker)
+        self._fit_worker = worker
+        self.view.show_popup(message, on_cancel=self._cancel_fit)
+        worker.start()
+
+    def _on_fit_progress(self, worker, message: str, index: int, total: int, name):
+        if worker.isInterruptionRequested():
+            return
+        self.view.show_popup(
+            f"{message}\n({index + 1}/{total}: {name})", on_cancel=self._cancel_fit
+        )
+
+    def _on_fit_done(self, kind: str, state: dict, on_done):
         self.view.close_popup()
-        self.view.error(f"GMM fitting failed: {message}")
+        try:
+            self.model.load_fit_state(kind, state)
+        except Exception as exc:
+            self._handle_fit_failed(kind, str(exc))
+            return
+        on_done()
 
-    def _clear_gmm_worker(self):
+    def _cancel_fit(self):
+        if self._fit_worker is not None:
+            self._fit_worker.cancel()
         self.view.close_popup()
-        if self._gmm_fit_worker is not None:
-            self._gmm_fit_worker.deleteLater()
-            self._gmm_fit_worker = None
-
-    def _compute_rub_scores(self, frames):
-        scores = []
-        for frame in frames:
-            if frame.size == 0:
-                continue
-            try:
-                score = self.model.compute_rub_anomaly(frame)
-            except Exception as exc:
-                self.view.error(str(exc))
-                return []
-            scores.append(score)
-        return scores
+
+    def _handle_fit_failed(self, kind: str, message: str):
+        self.view.close_popup()
+        self._discard_fit_data(kind)
+        self.view.error(f"Fitting failed: {message}")
+
+    def _handle_fit_cancelled(self, kind: str):
+        self.view.close_popup()
+        self._discard_fit_data(kind)
+        # 画面を離れたことによる取り消しは知らせない
+        if self.view.isVisible():
+            self.view.error("Fitting was cancelled. Please collect the samples again.")
+
+    def _discard_fit_data(self, kind: str):
+        # 打音は目標数ちょうどで学習するので、学習できなかったサンプルは捨てて取り直す
+        if kind == "tap":
+            self._delete_train_data()
+            self._set_tapping()
+
+    def _clear_fit_worker(self):
+        if self._fit_worker is not None:
+            self._fit_worker.deleteLater()
+            self._fit_worker = None
+
+    def _compute_rub_scores(self, features):
+        try:
+            return self.model.score_rub_features(*features)
+        except Exception as exc:
+            self.view.error(str(exc))
+            return []
 
     def _reset_rub_learning(self):
         if self.model.rub_session.is_active():
@@ -300,7 +385,8 @@ class TrainController(ControllerBase):
         self.model.rub_trained = False
         self.model.gmm_trained = False
         self.model.reset_rub_session()
-        self.model.reset_gmm_pipeline()
+        # 削除を選んだ学習結果は次の学習の初期値にも使わない
+        self.model.reset_gmm_pipeline(keep_warm_start=False)
         self.model.pretrain_score_mean = 0.0
         self.model.pretrain_score_std = 1.0
         self.model.train_score_mean = 0.0
@@ -347,11 +433,39 @@ class TrainController(ControllerBase):
 
     def handle_audio(self):
         if self.model.audio_is_stream and self.model.current_window == Window.TRAIN:
-            self.view.plot(self.view.audio_curve, self.model.buffer_data)
+            buffer = self.model.buffer_data
+            x0, x1, zoomed, width = self.view.audio_view_state()
+            envelope = self._envelope
+            if (
+                envelope is None
+                or envelope.span != buffer.size
+                or envelope.width != width
+            ):
+                # 表示幅が変わったらバッファ全体からエンベロープを作り直す
+                envelope = self._envelope = MinMaxEnvelope(buffer.size, width)
+                self._audio_cursor = self.model.sample_count - buffer.size
+            samples, self._audio_cursor = self.model.samples_since(self._audio_cursor)
+            envelope.update(samples, self._audio_cursor)
+
+            lo = max(0, int(np.floor(x0)))
+            hi = min(buffer.size, int(np.ceil(x1)) + 1)
+            if zoomed and hi - lo <= 2 * width:
+                # 画素数より少ないサンプルしか見えないほど拡大したときだけ生波形を描く
+                self.view.plot(
+                    self.view.audio_curve, buffer[lo:hi], x=np.arange(lo, hi)
+                )
+            else:
+                x, y = envelope.xy()
+                self.view.plot(self.view.audio_curve, y, x=x)
 
     def handle_camera(self):
         if self.model.camera_is_stream and self.model.current_window == Window.TRAIN:
-            self.view.image(self.view.camera_image, self.model.camera_data)
+            frame, timestamp = self.model.camera_frame
+            # 未取得のときと前回と同じフレームのときは描画し直さない
+            if frame is None or timestamp == self._camera_timestamp:
+                return
+            self._camera_timestamp = timestamp
+            self.view.image(self.view.camera_image, frame)
 
     def handle_train_data(self):
         if not self.model.trained:
@@ -362,10 +476,17 @@ class TrainController(ControllerBase):
             )
 
             if self.model.tap_train_sample_number == self.model.tap_train_target_count:
-                self.model.pipeline.fit(self.model.train_data)
-                self.model.trained = True
-                self._set_tapping()
                 self._tap_train_sample_stop()
+                self._start_fit(
+                    "tap",
+                    self.model.train_data,
+                    "Tap training is running...",
+                    self._on_tap_fit_done,
+                )
+
+    def _on_tap_fit_done(self):
+        self.model.trained = True
+        self._set_tapping()
 
     def handle_threshold_data(self):
         if not self.model.thresholded:
@@ -155,8 +155,18 @@ class TrainView(ViewBase):
     def image(self, target, data):
         target.setImage(data)
 
-    def plot(self, target, data):
-        target.setData(y=data)
+    def plot(self, target, data, x=None):
+        if x is None:
+            target.setData(y=data)
+        else:
+            target.setData(x=x, y=data)
+
+    def audio_view_state(self):
+        """波形プロットの表示範囲(x0, x1)、ズーム中か、表示幅(画素)を返す。"""
+        view_box = self.audio_plot.getViewBox()
+        (x0, x1), _ = view_box.viewRange()
+        zoomed = not view_box.autoRangeEnabled()[0]
+        return x0, x1, zoomed, max(1, int(view_box.width()))
 
     def _set_active_button(self, button, active: bool):
         style = (
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class MinMaxEnvelope:
+    """波形を表示幅1画素ぶんのサンプルごとに最小値/最大値へ間引くエンベロープ。
+
+    直近 span サンプルを width 画素で描く前提で、bucket = ceil(span / width)
+    サンプルごとの最小値と最大値をリングに保持する。update には新しく届いた
+    サンプルだけを渡せばよく、計算量は新しいサンプル数に比例する。
+    xy は (x, y) を [min, max] の順に交互に並べた配列で返し、x は直近 span
+    サンプルの窓の先頭を0とするサンプル位置なので、生波形と同じ座標で描ける。
+    """
+
+    def __init__(self, span: int, width: int):
+        self.span = int(span)
+        self.width = max(1, int(width))
+        self.bucket = max(1, -(-self.span // self.width))
+        self.n_buckets = -(-self.span // self.bucket) + 1
+        self._min = np.zeros(self.n_buckets)
+        self._max = np.zeros(self.n_buckets)
+        self._x = np.empty(2 * self.n_buckets)
+        self._y = np.empty(2 * self.n_buckets)
+        self._count: int = 0
+        self._valid_from: int = 0
+
+    def update(self, samples: np.ndarray, total: int) -> None:
+        """累積 total サンプル目で終わる新しいサンプルを取り込む。"""
+        samples = np.asarray(samples, dtype=float).ravel()
+        start = int(total) - samples.size
+        if start != self._count:
+            # 取りこぼしがあった(または初回)ので、ここから先だけを有効にする
+            self._valid_from = start
+        self._count = start
+        if samples.size == 0:
+            self._count = int(total)
+            return
+
+        bucket = self.bucket
+        pos = start
+        head = min(samples.size, (-pos) % bucket)
+        if head:
+            self._merge(pos, samples[:head])
+            pos += head
+
+        body = (samples.size - head) // bucket
+        if body:
+            block = samples[head : head + body * bucket].reshape(body, bucket)
+            index = (pos // bucket + np.arange(body)) % self.n_buckets
+            self._min[index] = block.min(axis=1)
+            self._max[index] = block.max(axis=1)
+            pos += body * bucket
+
+        tail = samples[head + body * bucket :]
+        if tail.size:
+            self._merge(pos, tail)
+        self._count = int(total)
+
+    def _merge(self, pos: int, chunk: np.ndarray) -> None:
+        index = (pos // self.bucket) % self.n_buckets
+        lo, hi = chunk.min(), chunk.max()
+        if pos % self.bucket == 0 or pos == self._valid_from:
+            self._min[index], self._max[index] = lo, hi
+        else:
+            self._min[index] = min(self._min[index], lo)
+            self._max[index] = max(self._max[index], hi)
+
+    def xy(self) -> tuple[np.ndarray, np.ndarray]:
+        """直近 span サンプルのエンベロープを (x, y) のビューで返す。"""
+        total = self._count
+        window_start = total - self.span
+        first = max(window_start, self._valid_from, 0) // self.bucket
+        last = (total - 1) // self.bucket
+        n = max(0, last - first + 1)
+        if n == 0:
+            return self._x[:0], self._y[:0]
+
+        buckets = np.arange(first, last + 1)
+        index = buckets % self.n_buckets
+        x = np.maximum(buckets * self.bucket, window_start) - window_start
+        self._x[0 : 2 * n : 2] = x
+        self._x[1 : 2 * n : 2] = x
+        self._y[0 : 2 * n : 2] = self._min[index]
+        self._y[1 : 2 * n : 2] = self._max[index]
+        return self._x[: 2 * n], self._y[: 2 * n]
+
+    def clear(self) -> None:
+        self._count = 0
+        self._valid_from = 0
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def classify(values, thresholds) -> np.ndarray:
+    """値を昇順の閾値で段階分けし、段階番号(0始まり)の配列を返す。
+
+    閾値 (t1, t2) なら v < t1 が0、t1 <= v < t2 が1、それ以上が2になる。
+    """
+    return np.searchsorted(
+        np.asarray(thresholds, dtype=float),
+        np.asarray(values, dtype=float),
+        side="right",
+    )
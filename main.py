@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
 import sys
 from pathlib import Path
@@ -56,4 +57,6 @@ def main() -> int:
 
 
 if __name__ == "__main__":
+    # GMMのモデル選択はプロセスプールを使うので、exe化したときの子プロセス起動に備える
+    multiprocessing.freeze_support()
     sys.exit(main())
@@ -0,0 +1,132 @@
+# main.py
+# 合成/ファイル音声を最高速で再生し、キュー→トリガー→推論パイプラインの処理能力を測る
+# 使い方: python main.py [WAVまたは.npyのパス]
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.model.block_queue import BlockQueue  # noqa: E402
+from app.model.ring import RingBuffer  # noqa: E402
+from app.model.source import FileSource, SyntheticSource  # noqa: E402
+from app.model.trigger import Trigger  # noqa: E402
+from app.pipeline.pipeline import melspec_zscore  # noqa: E402
+
+
+def make_model():
+    # app.model.model.Model の音声・パイプライン設定と同じ値
+    model = SimpleNamespace(
+        sample_rate=48000,
+        input=2,
+        dtype="int16",
+        block_size=2048,
+        ch=0,
+        eu=0.1,
+        block_queue_size=32,
+        trigger_is_active=True,
+        trigger_threshold=10.0,
+        trigger_index=0,
+        trigger_data=np.array([]),
+        bandpass_min_hz=300,
+        bandpass_max_hz=16000,
+        bandpass_pass_ripple_db=3,
+        bandpass_stop_ripple_db=40,
+        spectral_band_limit=None,
+        decimate_sample_rate=None,
+        fft_size=4096,
+        fft_bins=int(4096 / 2.56) + 1,
+        fft_power=2,
+        fft_window="hann",
+        fft_fused=True,
+        stft_overlap=3072,
+        mel_bins=40,
+        mel_min_hz=1000,
+        mel_max_hz=16000,
+    )
+    model._buffer_data = RingBuffer(int(1.0 * model.sample_rate))
+    return model
+
+
+def fit_pipeline(model):
+    # 合成の叩き音から学習用の窓を切り出して ZScore を学習する
+    source = SyntheticSource(model, kind="tap", duration=16.0, seed=1)
+    blocks = []
+    while (block := source.next_block(4096)) is not None:
+        blocks.append(block[:, 0])
+    data = np.concatenate(blocks)
+    onsets = np.arange(0, data.size - 4096, int(0.5 * model.sample_rate))
+    windows = np.stack([data[i : i + 4096] * model.eu for i in onsets])
+    pipeline = melspec_zscore(model)
+    pipeline.fit(windows)
+    return pipeline
+
+
+def run(model, source, pipeline):
+    queue = BlockQueue(model.block_queue_size, model.block_size)
+    trigger = Trigger(model)
+    hits = []
+
+    def callback(indata, frames, _time, status):
+        if status.input_overflow:
+            queue.mark_overflow()
+        slot = queue.reserve()
+        if slot is None:
+            return
+        n = min(frames, slot.size)
+        np.multiply(indata[:n, model.ch], model.eu, out=slot[:n])
+        queue.commit(n, time.monotonic())
+
+    samples = 0
+    start = time.perf_counter()
+    source.start(callback, queue.writable)
+    while True:
+        finished = source.wait(0.001)
+        for block, _stamp in queue.drain():
+            block = np.array(block)
+            begin = model._buffer_data.total
+            model._buffer_data.write(block)
+            trigger.process_block(block, begin)
+            for index, window in list(trigger._hits):
+                hits.append((index, float(pipeline.transform(window)[0])))
+            trigger._hits.clear()
+            samples += block.size
+        if finished and len(queue) == 0:
+            break
+    elapsed = time.perf_counter() - start
+    source.stop()
+
+    audio_sec = samples / model.sample_rate
+    print(
+        "  audio {:6.1f} s  wall {:6.2f} s  x{:6.1f} realtime  "
+        "{:7.0f} blocks/s  hits={}  {}  {}".format(
+            audio_sec,
+            elapsed,
+            audio_sec / elapsed,
+            samples / model.block_size / elapsed,
+            len(hits),
+            queue,
+            trigger,
+        )
+    )
+
+
+def main():
+    model = make_model()
+    pipeline = fit_pipeline(model)
+    if len(sys.argv) > 1:
+        print(f"[file] {sys.argv[1]}")
+        run(model, FileSource(model, sys.argv[1], max_speed=True), pipeline)
+        return
+    for kind in ("tap", "rub"):
+        print(f"[synthetic:{kind}] 60 s, max speed")
+        model._buffer_data.clear()
+        source = SyntheticSource(model, kind=kind, duration=60.0, max_speed=True)
+        run(model, source, pipeline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# main.py
+# sklearn の GaussianMixture.score_samples と FastGMMScorer の速度・一致度を比べる
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.mixture import GaussianMixture
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.pipeline.gmm import FastGMMScorer  # noqa: E402
+
+
+def make_features(rng, n, n_features=40):
+    # メルスペクトルに似た、相関のある正の値の特徴量
+    base = rng.gamma(2.0, 1.0, size=(n, 1)) * np.linspace(1.0, 0.1, n_features)
+    return (base + 0.1 * rng.standard_normal((n, n_features))) * 1e-4
+
+
+def make_offset_features(rng, n, n_features=40, offset=-300.0):
+    # 正規化前の対数メルのように、広がりに比べて平均が0から遠い特徴量
+    base = rng.standard_normal((n, 1)) * np.linspace(0.5, 0.05, n_features)
+    return offset + base + 0.02 * rng.standard_normal((n, n_features))
+
+
+def timeit(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    rng = np.random.default_rng(0)
+    train = make_features(rng, 2000)
+    print("{:<10} {:>3} {:>5} {:>11} {:>11} {:>7} {:>10}".format(
+        "cov", "K", "rows", "sklearn us", "fast us", "speedup", "max|diff|"
+    ))
+    for covariance_type in ("full", "diag"):
+        for n_components in (2, 8):
+            mixture = GaussianMixture(
+                n_components, covariance_type=covariance_type, random_state=0
+            ).fit(train)
+            scorer = FastGMMScorer.from_mixture(mixture)
+            # 1ティック分(数フレーム)と学習後の一括採点の大きさで比べる
+            for rows in (2, 32, 500):
+                X = make_features(rng, rows)
+                t_sk = timeit(lambda: mixture.score_samples(X), 300)
+                t_fast = timeit(lambda: scorer.score_samples(X), 300)
+                diff = np.max(np.abs(mixture.score_samples(X) - scorer.score_samples(X)))
+                print("{:<10} {:>3} {:>5} {:>11.1f} {:>11.1f} {:>6.1f}x {:>10.2e}".format(
+                    covariance_type, n_components, rows,
+                    t_sk * 1e6, t_fast * 1e6, t_sk / t_fast, diff,
+                ))
+
+    # 平均が大きい特徴量でも、中心化を float64 で行うので sklearn と一致する
+    tolerance = 1e-4
+    offset_train = make_offset_features(rng, 2000)
+    for covariance_type in ("full", "diag"):
+        mixture = GaussianMixture(
+            4, covariance_type=covariance_type, random_state=0
+        ).fit(offset_train)
+        scorer = FastGMMScorer.from_mixture(mixture)
+        X = make_offset_features(rng, 500)
+        expected = mixture.score_samples(X)
+        diff = np.max(np.abs(expected - scorer.score_samples(X)))
+        print("offset {:<6} logp~{:8.1f} max|diff|={:.2e} (tolerance {:.0e})".format(
+            covariance_type, expected.mean(), diff, tolerance
+        ))
+        assert diff < tolerance, diff
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# main.py
+# GMM のオンラインEM(partial_fit)が学習結果を崩さないこと、追加データで
+# 全データの学習し直しに近づくことを、共分散形式ごとに確かめる。
+# 前回の結果を残して作り直しても、モデル選択や設定の変更が効くことも確かめる
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.pipeline.gmm import GMM  # noqa: E402
+
+
+def make_config(covariance_type, **overrides):
+    config = SimpleNamespace(
+        n_components=3,
+        covariance_type=covariance_type,
+        random_state=0,
+        gmm_selection=None,
+        gmm_candidate_components=(1, 2, 3, 4),
+        gmm_candidate_covariances=("full", "diag"),
+        gmm_n_init=1,
+        gmm_selection_tolerance=0.01,
+        gmm_selection_workers=1,
+        gmm_warm_start=True,
+        gmm_online_update=False,
+        gmm_online_decay=None,
+        gmm_batch_size=2048,
+    )
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return config
+
+
+def make_features(rng, n, n_features=20, shift=0.0):
+    # 擦りの対数メルのように分散の小さい次元を含むクラスター
+    labels = rng.integers(0, 3, n)
+    centers = np.array([0.0, 3.0, -3.0])[:, np.newaxis] + shift
+    scale = np.geomspace(1e-3, 1.0, n_features)
+    return centers[labels] + rng.standard_normal((n, n_features)) * scale
+
+
+def variances(mixture):
+    cov = mixture.covariances_
+    if mixture.covariance_type in ("full", "tied"):
+        return np.diagonal(cov, axis1=-2, axis2=-1)
+    return cov
+
+
+def check_refit_after_reset(train):
+    # Model.reset_gmm_pipeline(keep_warm_start=True) と同じく、前回の結果を渡して作り直す
+    config = make_config("diag")
+    previous = GMM(config).fit(train).export_state()
+
+    # モデル選択が有効なら、前回の結果があっても候補から選び直す
+    selecting = make_config("diag", gmm_selection="bic")
+    refit = GMM(selecting)
+    refit.warm_start_from(previous)
+    refit.fit(train)
+    assert len(refit.candidates_) > 0, refit.candidates_
+
+    # 成分数・共分散形式を変えたら、前回の結果を初期値にしない
+    changed = make_config("full", n_components=2)
+    refit = GMM(changed)
+    refit.warm_start_from(previous)
+    refit.fit(train)
+    assert refit.gmm_.n_components == 2, refit.gmm_.n_components
+    assert refit.gmm_.covariance_type == "full", refit.gmm_.covariance_type
+    print("refit after reset: selection and changed settings take effect")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    train = make_features(rng, 6000)
+    extra = make_features(rng, 12000, shift=0.2)
+    test = make_features(rng, 4000, shift=0.2)
+    print("{:<10} {:>10} {:>10} {:>10} {:>11} {:>11}".format(
+        "cov", "d mean", "d var", "d logp", "online", "refit"
+    ))
+    for covariance_type in ("full", "tied", "diag", "spherical"):
+        config = make_config(covariance_type)
+        gmm = GMM(config).fit(train)
+        means = gmm.gmm_.means_.copy()
+        var = variances(gmm.gmm_).copy()
+        logp = gmm.gmm_.score_samples(train)
+
+        # 学習に使ったデータでオンライン更新しても、分布はほとんど変わらない
+        gmm.partial_fit(train, log=False)
+        d_mean = np.max(np.abs(gmm.gmm_.means_ - means))
+        d_var = np.max(np.abs(variances(gmm.gmm_) - var) / var)
+        d_logp = np.max(np.abs(gmm.gmm_.score_samples(train) - logp))
+        assert d_mean < 1e-3, d_mean
+        assert d_var < 1e-2, d_var
+        assert d_logp < 1e-2, d_logp
+
+        # 追加データのオンライン更新は、全データでの学習し直しに近い
+        online = GMM(config).fit(train).partial_fit(extra, log=False)
+        refit = GMM(config).fit(np.vstack([train, extra]))
+        online_logp = online.gmm_.score(test)
+        refit_logp = refit.gmm_.score(test)
+        assert abs(online_logp - refit_logp) < 1e-2 * abs(refit_logp), (
+            online_logp,
+            refit_logp,
+        )
+        print("{:<10} {:>10.2e} {:>10.2e} {:>10.2e} {:>11.3f} {:>11.3f}".format(
+            covariance_type, d_mean, d_var, d_logp, online_logp, refit_logp
+        ))
+    check_refit_after_reset(train)
+
+
+if __name__ == "__main__":
+    main()